@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# Sync views run on executor threads under ASGI, hand connections back to
+# a shared pool at the end of each request instead of pinning one per thread
+os.environ.setdefault('DB_POOL_ENABLED', 'true')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -46,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Custom middleware, first so maintenance skips all the others
+    'core.middleware.common.MaintenanceModeMiddleware',
+    'core.middleware.common.LoadSheddingMiddleware',
+    'core.middleware.common.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,8 +58,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # Custom middleware
-    'core.middleware.common.MaintenanceModeMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -77,21 +80,59 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# Keeps the maintenance flag from being re-read while queries are counted
+TEST_RUNNER = 'core.tests.runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Seconds to keep a connection open across requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get(
+            'DB_CONN_HEALTH_CHECKS', 'true') == 'true',
+        # In-process pool, enabled by default under ASGI (see app/asgi.py)
+        'POOL': {
+            'ENABLED': os.environ.get('DB_POOL_ENABLED') == 'true',
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'IDLE_TIMEOUT': int(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Point this at memcached when running several workers
+    'shared': {
+        'BACKEND': os.environ.get(
+            'SHARED_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'shared'),
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_ENTRIES', 5000)),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -139,3 +180,138 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom settings
 AUTH_USER_MODEL = 'core.User'
 MAINTENANCE_MODE = False
+
+# core.maintenance runtime flag, toggled with `manage.py maintenance on`
+MAINTENANCE = {
+    # Seconds a worker trusts its copy of the flag in the database
+    'TTL': 5,
+    'RETRY_AFTER': 120,
+    'ALLOWED_PATHS': ['/admin/', '/health/', '/metrics'],
+}
+
+# core.shedding concurrency limits per route class, adapted from latency
+LOAD_SHEDDING = {
+    'ENABLED': os.environ.get('LOAD_SHEDDING', 'true') == 'true',
+    # Route classes, each shed on its own limit only
+    'CLASSES': ['auth', 'write', 'read'],
+    'AUTH_PATHS': ['/api/v1/user/token/', '/api/v1/user/create/'],
+    'EXEMPT_PATHS': ['/admin/', '/health/', '/metrics'],
+    'INITIAL_LIMIT': 20,
+    'MIN_LIMIT': 2,
+    'MAX_LIMIT': int(os.environ.get('LOAD_SHEDDING_MAX_LIMIT', 200)),
+    # Latency may grow to TOLERANCE times the baseline before shrinking
+    'TOLERANCE': 1.5,
+    'LATENCY_SMOOTHING': 0.2,
+    'LIMIT_SMOOTHING': 0.2,
+    'WINDOW': 500,
+    'RETRY_AFTER': 1,
+}
+
+# core.metrics histograms per route, exported at /metrics
+METRICS = {
+    'ENABLED': os.environ.get('METRICS', 'true') == 'true',
+    # Workers publish their histograms here for /metrics to export them
+    # with a `worker` label, sum them in queries: sum by (route) (...)
+    'CACHE': 'shared',
+    'FLUSH_INTERVAL': 15,
+    # A worker that stopped publishing drops out after this many seconds
+    'WORKER_TTL': 300,
+}
+
+# core.query_budget checks of the queries run per view action, `raise`
+# fails the request, `log` logs it, `sample` checks SAMPLE_RATE of them
+QUERY_BUDGET = {
+    'MODE': os.environ.get('QUERY_BUDGET_MODE',
+                           'raise' if DEBUG else 'sample'),
+    'SAMPLE_RATE': float(os.environ.get('QUERY_BUDGET_SAMPLE_RATE', 0.01)),
+    # Budget of the actions a view declares none for
+    'DEFAULT': {'QUERIES': 30, 'DB_MS': 500},
+}
+
+# recipe.export reads this many recipes per server side cursor fetch
+RECIPE_EXPORT = {
+    'CHUNK_SIZE': int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000)),
+}
+
+# recipe.importing rows written per transaction, and row errors reported
+RECIPE_IMPORT = {
+    'BATCH_SIZE': int(os.environ.get('RECIPE_IMPORT_BATCH_SIZE', 500)),
+    'MAX_ERRORS': 100,
+}
+
+# core.jobs queue worked by `manage.py run_worker`
+JOBS = {
+    'CONCURRENCY': int(os.environ.get('JOBS_CONCURRENCY', 4)),
+    # `thread` or `process`, processes suit CPU bound tasks
+    'POOL': os.environ.get('JOBS_POOL', 'thread'),
+    'POLL_INTERVAL': 1,
+    'MAX_ATTEMPTS': 5,
+    # Retry after BACKOFF_BASE * 2 ** (attempts - 1) seconds, jittered
+    'BACKOFF_BASE': 10,
+    'BACKOFF_MAX': 3600,
+    # Input files of queued jobs, shared by the web and worker hosts
+    'FILE_DIR': os.environ.get('JOBS_FILE_DIR',
+                               os.path.join(BASE_DIR, 'jobfiles')),
+    # Days finished jobs are kept for `manage.py purge_jobs`
+    'RETENTION': int(os.environ.get('JOBS_RETENTION', 7)),
+    # A running job is claimed again when not finished or heartbeating
+    # within this many seconds, as after its worker died
+    'LEASE': 600,
+}
+
+# core.models.AuthToken lifetime in seconds, sliding tokens are extended
+# on use once half of the lifetime has passed
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 7 * 24 * 60 * 60))
+TOKEN_SLIDING_REFRESH = os.environ.get('TOKEN_SLIDING_REFRESH') == 'true'
+
+# core.response_cache.ResponseCacheMixin for the recipe app lists
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE') == 'true',
+    'CACHE': 'responses',
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300)),
+    # Larger responses are not cached
+    'MAX_BYTES': int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 256 * 1024)),
+}
+
+# core.authentication.CachedTokenAuthentication
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000)),
+    'TTL': int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 30)),
+    # Cache alias shared between workers, None to disable
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE'),
+}
+
+# recipe.autocomplete.AutocompleteMixin on the tag and ingredient lists
+AUTOCOMPLETE = {
+    'CACHE': 'default',
+    'TIMEOUT': int(os.environ.get('AUTOCOMPLETE_TIMEOUT', 30)),
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+}
+
+# core.hashing pool password hashing and verification run on
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', 4)),
+    # Requests waiting for a worker, past that logins get a 503
+    'MAX_QUEUE': int(os.environ.get('PASSWORD_HASHING_QUEUE', 16)),
+    'TIMEOUT': 10,
+    'RETRY_AFTER': 1,
+}
+
+# Client addresses of throttles come from REMOTE_ADDR unless the app runs
+# behind NUM_PROXIES trusted proxies, X-Forwarded-For is client supplied
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# core.throttling limits of the token endpoint, per client address and
+# per submitted email, RATE is in attempts per second
+LOGIN_THROTTLE = {
+    'IP': {'CAPACITY': 20, 'RATE': 20 / 60},
+    'EMAIL': {'CAPACITY': 5, 'RATE': 5 / 300},
+    # Failed logins before an email or address is locked out, the lockout
+    # starts at BASE seconds and doubles per further failure up to MAX
+    'LOCKOUT': {'THRESHOLD': 5, 'BASE': 60, 'MAX': 3600},
+    'MAX_ENTRIES': 100000,
+    'SHARED_CACHE': os.environ.get('LOGIN_THROTTLE_SHARED_CACHE', 'shared'),
+}
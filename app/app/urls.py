@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from core.views import MetricsView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/user/', include('user.urls')),
     path('api/v1/', include('recipe.urls')),
+    path('api/v1/', include('core.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
-from core import models
+from core import models, versioning
 
 
 class UserAdmin(BaseUserAdmin):
@@ -24,8 +24,18 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def delete_model(self, request, obj):
+        with versioning.deleting(obj):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with versioning.deleting(*queryset):
+            super().delete_queryset(request, queryset)
+
 
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
 admin.site.register(models.Recipe)
+admin.site.register(models.AuthToken)
+admin.site.register(models.Job)
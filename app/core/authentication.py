@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.models import AuthToken
+
+
+class TokenCache:
+    """Bounded in-process LRU of token key -> (user, token) with a TTL"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (user, token) pair or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        """Cache a (user, token) pair, evicting the least recently used"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        """Drop every cached token belonging to the user"""
+        with self._lock:
+            stale = [key for key, ((user, token), expires)
+                     in self._entries.items() if user.pk == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """Return the process wide token cache built from settings"""
+    global _token_cache
+    if _token_cache is None:
+        conf = settings.TOKEN_AUTH_CACHE
+        _token_cache = TokenCache(conf['MAX_SIZE'], conf['TTL'])
+    return _token_cache
+
+
+def reset_token_cache():
+    """Forget the process wide token cache so settings are re-read"""
+    global _token_cache
+    _token_cache = None
+
+
+def get_shared_cache():
+    """Return the optional shared cache tier or None when disabled"""
+    alias = settings.TOKEN_AUTH_CACHE.get('SHARED_CACHE')
+    return caches[alias] if alias else None
+
+
+def shared_cache_key(key):
+    return 'token-auth:%s' % key
+
+
+def invalidate_token(key):
+    """Remove a token from both cache tiers"""
+    get_token_cache().delete(key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(shared_cache_key(key))
+
+
+def invalidate_user(user):
+    """Remove every token of the user from both cache tiers"""
+    get_token_cache().delete_user(user.pk)
+    shared = get_shared_cache()
+    if shared is not None:
+        keys = AuthToken.objects.filter(
+            user=user).values_list('key', flat=True)
+        shared.delete_many([shared_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token -> user lookup
+
+    Tokens are looked up in a process local LRU first, then in the shared
+    cache tier when one is configured, and only then in the database.
+    Entries are dropped on token deletion and user changes, other worker
+    processes see the change once their local TTL runs out.
+
+    Expiry is checked against the token row that was already loaded, so
+    rejecting an expired token costs no extra query.
+    """
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        now = timezone.now()
+        cached = self.get_cached(key)
+        if cached is not None and cached[1].is_expired(now) \
+                and settings.TOKEN_SLIDING_REFRESH:
+            # Another worker may have slid the expiry forward
+            invalidate_token(key)
+            cached = None
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            self.set_cached(key, cached)
+
+        user, token = cached
+        if token.is_expired(now):
+            invalidate_token(key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if settings.TOKEN_SLIDING_REFRESH and token.needs_refresh(now):
+            token.refresh()
+            self.set_cached(key, cached)
+
+        # Requests must not share (and mutate) the cached instance
+        return copy.copy(user), token
+
+    def get_cached(self, key):
+        cached = get_token_cache().get(key)
+        if cached is None:
+            shared = get_shared_cache()
+            if shared is not None:
+                cached = shared.get(shared_cache_key(key))
+                if cached is not None:
+                    get_token_cache().set(key, cached)
+        return cached
+
+    def set_cached(self, key, value):
+        get_token_cache().set(key, value)
+        shared = get_shared_cache()
+        if shared is not None:
+            shared.set(shared_cache_key(key), value,
+                       settings.TOKEN_AUTH_CACHE['TTL'])
@@ -0,0 +1,78 @@
+import functools
+
+from django.db.backends.postgresql import base
+
+from core.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend with health checked persistent connections and
+    an optional in-process pool
+
+    With `CONN_HEALTH_CHECKS` a persistent connection carried over from a
+    previous request is pinged before its first query in the new request
+    and replaced if the server went away, instead of failing that query.
+    With `POOL['ENABLED']` closing a connection returns it to a per
+    process pool and opening one reuses an idle pooled connection, so the
+    connection handshake is paid once per pooled connection and not per
+    request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool = None
+
+    @property
+    def pool_options(self):
+        return self.settings_dict.get('POOL') or {}
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def get_pool(self, conn_params):
+        """Pools are keyed by the connection parameters, so renaming the
+        database (as the test runner does) never reuses a connection to
+        the old one"""
+        key = (self.alias, tuple(sorted(conn_params.items())))
+        return get_pool(key, functools.partial(
+            super().get_new_connection, conn_params), self.pool_options)
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_options.get('ENABLED'):
+            return super().get_new_connection(conn_params)
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.acquire(check=self.health_check_enabled)
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level',
+                                           connection.isolation_level)
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
+            return
+        return super()._close()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        """Replace a reused connection that no longer answers"""
+        if self.connection is None or not self.health_check_enabled or \
+                self.health_check_done or self.in_atomic_block:
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
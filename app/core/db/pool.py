@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+from django.db.utils import OperationalError
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Bounded pool of open DB-API connections shared by the threads of
+    one process
+
+    Idle connections are handed out most recently used first so the pool
+    shrinks back when load drops, connections idle for longer than
+    `idle_timeout` are closed instead of reused. When `max_size`
+    connections are checked out `acquire` waits up to `timeout` seconds
+    for one to be released.
+    """
+
+    def __init__(self, connect, max_size=10, idle_timeout=300, timeout=5):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.idle = []
+        self.size = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, check=False):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                conn = self._pop_idle()
+                if conn is not None:
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(
+                        'Connection pool exhausted (%d connections in use)'
+                        % self.max_size)
+                self.condition.wait(remaining)
+
+        if conn is None:
+            try:
+                return self.connect()
+            except Exception:
+                self._discard(None)
+                raise
+        if check and not self.is_usable(conn):
+            self._discard(conn)
+            return self.acquire(check)
+        return conn
+
+    def release(self, conn):
+        """Return a connection, closing it if it is broken or was left
+        inside a transaction"""
+        if conn.closed or conn.get_transaction_status() != \
+                extensions.TRANSACTION_STATUS_IDLE:
+            self._discard(conn)
+            return
+        with self.condition:
+            self.idle.append((time.monotonic(), conn))
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        for _, conn in idle:
+            conn.close()
+
+    def is_usable(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def _pop_idle(self):
+        now = time.monotonic()
+        while self.idle:
+            released, conn = self.idle.pop()
+            if not conn.closed and now - released < self.idle_timeout:
+                return conn
+            self.size -= 1
+            conn.close()
+        return None
+
+    def _discard(self, conn):
+        if conn is not None and not conn.closed:
+            conn.close()
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+
+def get_pool(key, connect, options):
+    """Return the pool stored under `key`, one per process so forked
+    workers never share sockets"""
+    key = (os.getpid(), key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                connect,
+                max_size=options.get('MAX_SIZE', 10),
+                idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                timeout=options.get('TIMEOUT', 5),
+            )
+    return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
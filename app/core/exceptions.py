@@ -0,0 +1,28 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+
+
+class ServiceBusy(exceptions.APIException):
+    """503 telling the client when to retry"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Server is busy, try again shortly.')
+    default_code = 'service_busy'
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class ImportConflict(exceptions.APIException):
+    """409 for an import whose key another run advanced meanwhile"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('Another import with this key is running.')
+    default_code = 'import_conflict'
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more queries than its declared budget"""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
@@ -0,0 +1,106 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core.exceptions import ServiceBusy
+
+
+class HashingPool:
+    """Bounded executor for password hashing
+
+    At most `workers` hashes run at once and `max_queue` more wait, any
+    further request is rejected right away with ServiceBusy instead of
+    holding a request worker for seconds. PBKDF2 releases the GIL, so the
+    workers use the spare cores while request threads only wait on them.
+    """
+
+    def __init__(self, workers, max_queue, timeout, retry_after):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise ServiceBusy(wait=self.retry_after)
+        try:
+            future = self.executor.submit(func, *args)
+        except RuntimeError:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise ServiceBusy(wait=self.retry_after)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """Return the process wide pool built from PASSWORD_HASHING, a forked
+    worker builds its own"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            conf = settings.PASSWORD_HASHING
+            _pool = HashingPool(conf['WORKERS'], conf['MAX_QUEUE'],
+                                conf['TIMEOUT'], conf['RETRY_AFTER'])
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def reset_hashing_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+
+def make_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return get_hashing_pool().run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    """Check the password and whether its hash uses outdated parameters"""
+    if not hashers.check_password(password, encoded):
+        return False, False
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    must_update = hasher.algorithm != preferred.algorithm or \
+        preferred.must_update(encoded)
+    return True, must_update
+
+
+def check_password(password, encoded, setter=None):
+    """Like django.contrib.auth.hashers.check_password, hashing on the
+    pool
+
+    `setter` runs on the calling thread so the rehashed password is saved
+    on the request's own database connection.
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    try:
+        hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+
+    is_correct, must_update = get_hashing_pool().run(
+        _verify, password, encoded)
+    if setter and must_update:
+        setter(password)
+    return is_correct
@@ -0,0 +1,244 @@
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import uuid
+from concurrent import futures
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connections
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import Job
+from core.serializers import JobSerializer
+
+logger = logging.getLogger('core.jobs')
+
+_tasks = {}
+_discovered = False
+
+
+def task(name, max_attempts=None):
+    """Register the decorated function as the job task `name`
+
+    The function is called with the Job and returns its JSON result.
+    Raising retries the job after a backoff until it has been attempted
+    `max_attempts` (default JOBS['MAX_ATTEMPTS']) times.
+    """
+    def register(func):
+        _tasks[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def get_task(name):
+    """Return `(func, max_attempts)` of a task from an app's tasks module"""
+    global _discovered
+    if not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError('No job task %r' % name)
+
+
+def get_storage():
+    """Storage of the job input files, shared by the web and worker
+    hosts"""
+    return FileSystemStorage(location=settings.JOBS['FILE_DIR'])
+
+
+def enqueue(name, payload=None, user=None, file=None, delay=0):
+    """Queue a run of task `name`, due in `delay` seconds
+
+    A `file` is copied chunk by chunk to the job storage, the task reads
+    it back with `open_file()`. It is deleted once the job is done or
+    failed, or right away if the job cannot be created. Files of jobs
+    rolled back with an outer transaction are left to `purge_jobs`.
+    """
+    _, max_attempts = get_task(name)
+    stored = ''
+    if file is not None:
+        stored = get_storage().save('%s/%s' % (name, uuid.uuid4().hex),
+                                    file)
+    try:
+        return Job.objects.create(
+            task=name, payload=payload or {}, user=user, file=stored,
+            max_attempts=max_attempts or settings.JOBS['MAX_ATTEMPTS'],
+            run_at=timezone.now() + timedelta(seconds=delay))
+    except Exception:
+        delete_file(stored)
+        raise
+
+
+def open_file(job):
+    """Open the input file of `job` for reading"""
+    return get_storage().open(job.file, 'rb')
+
+
+def delete_file(name):
+    """Delete a stored input file, if any"""
+    if name:
+        get_storage().delete(name)
+
+
+def orphaned_files(before):
+    """Stored input files older than `before` that no job refers to"""
+    storage = get_storage()
+    if not storage.exists(''):
+        return
+    for directory in storage.listdir('')[0]:
+        names = ['%s/%s' % (directory, name)
+                 for name in storage.listdir(directory)[1]]
+        names = [name for name in names
+                 if storage.get_modified_time(name) < before]
+        referenced = set(Job.objects.filter(file__in=names)
+                         .values_list('file', flat=True))
+        for name in names:
+            if name not in referenced:
+                yield name
+
+
+def accepted(job):
+    """202 response pointing at the status of a queued job"""
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': reverse('core:job', args=[job.pk])})
+
+
+def backoff(attempts):
+    """Seconds before retrying a job failed `attempts` times, doubling
+    from BACKOFF_BASE up to BACKOFF_MAX with half of it jittered"""
+    conf = settings.JOBS
+    delay = min(conf['BACKOFF_MAX'],
+                conf['BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def heartbeat(job):
+    """Extend the lease of a running job, long tasks call this between
+    steps so no other worker claims the job meanwhile"""
+    Job.objects.filter(pk=job.pk, worker=job.worker).update(
+        run_at=timezone.now() + timedelta(seconds=settings.JOBS['LEASE']))
+
+
+def finish(job, **fields):
+    """Record the outcome unless another worker claimed the job since,
+    a done or failed job's input file is deleted"""
+    if fields['status'] in (Job.DONE, Job.FAILED):
+        fields['file'] = ''
+    updated = Job.objects.filter(pk=job.pk, worker=job.worker,
+                                 attempts=job.attempts).update(**fields)
+    if updated and 'file' in fields:
+        delete_file(job.file)
+    return updated
+
+
+def run(job):
+    """Run a claimed job and record whether it is done, queued again for
+    a retry or failed"""
+    now = timezone.now
+    if job.attempts > job.max_attempts:
+        # Claimed again after the lease of its last attempt ran out
+        finish(job, status=Job.FAILED, finished_at=now(),
+               error='Gave up after %d attempts' % job.max_attempts)
+        return
+    try:
+        func, _ = get_task(job.task)
+        result = func(job)
+    except LookupError as exc:
+        finish(job, status=Job.FAILED, finished_at=now(), error=str(exc))
+    except Exception as exc:
+        logger.exception('Job %d (%s) attempt %d failed', job.pk, job.task,
+                         job.attempts)
+        error = '%s: %s' % (type(exc).__name__, exc)
+        if job.attempts < job.max_attempts:
+            finish(job, status=Job.QUEUED, error=error,
+                   run_at=now() + timedelta(seconds=backoff(job.attempts)))
+        else:
+            finish(job, status=Job.FAILED, finished_at=now(), error=error)
+    else:
+        finish(job, status=Job.DONE, finished_at=now(), result=result,
+               error='')
+
+
+def execute(job_id):
+    """Pool entry point running one claimed job on the pool's own
+    database connection"""
+    close_old_connections()
+    try:
+        run(Job.objects.get(pk=job_id))
+    finally:
+        connections.close_all()
+
+
+class Worker:
+    """Claim due jobs and run them on a pool of threads or processes
+
+    Every POLL_INTERVAL seconds, or as soon as a job finishes, the worker
+    claims as many jobs as it has idle slots with one `UPDATE ... FOR
+    UPDATE SKIP LOCKED` statement, so any number of workers can share
+    the queue. `stop()` lets the running jobs finish.
+    """
+
+    def __init__(self, concurrency=None, pool=None, poll_interval=None):
+        conf = settings.JOBS
+        self.concurrency = concurrency or conf['CONCURRENCY']
+        self.pool = pool or conf['POOL']
+        self.poll_interval = poll_interval or conf['POLL_INTERVAL']
+        self.lease = conf['LEASE']
+        self.name = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.stopping = threading.Event()
+
+    def executor(self):
+        if self.pool == 'process':
+            # Spawned children set Django up and open their own
+            # connections instead of sharing the forked ones
+            return futures.ProcessPoolExecutor(
+                self.concurrency, initializer=django.setup,
+                mp_context=multiprocessing.get_context('spawn'))
+        return futures.ThreadPoolExecutor(self.concurrency,
+                                          thread_name_prefix='job')
+
+    def run(self, burst=False):
+        """Work until stopped, or with `burst` until no job is due, and
+        return the number of jobs run"""
+        count = 0
+        running = set()
+        with self.executor() as executor:
+            while not self.stopping.is_set():
+                done = {future for future in running if future.done()}
+                for future in done:
+                    if future.exception() is not None:
+                        logger.error('Job runner failed',
+                                     exc_info=future.exception())
+                running -= done
+
+                free = self.concurrency - len(running)
+                ids = Job.objects.dequeue(self.name, free, self.lease) \
+                    if free else []
+                for pk in ids:
+                    running.add(executor.submit(execute, pk))
+                count += len(ids)
+                if ids:
+                    continue
+                if not running:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                else:
+                    futures.wait(running, timeout=self.poll_interval,
+                                 return_when=futures.FIRST_COMPLETED)
+        return count
+
+    def stop(self):
+        self.stopping.set()
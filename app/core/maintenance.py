@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import HttpResponse
+
+from core.models import MaintenanceMode
+
+# Primary key of the single flag row
+FLAG_ID = 1
+
+# Rendered once, each response only gets its own Retry-After
+UNAVAILABLE_BODY = json.dumps('Service under maintenance').encode()
+
+_local = {'state': None, 'expires': 0}
+_lock = threading.Lock()
+
+
+def get_state():
+    """Return the active maintenance state or None
+
+    The flag row is re-read at most every MAINTENANCE['TTL'] seconds,
+    so workers on any host follow a toggle within that delay. When the
+    database cannot be read the last known state is kept. The static
+    MAINTENANCE_MODE setting switches maintenance on as well.
+    """
+    if settings.MAINTENANCE_MODE:
+        return {'retry_after': settings.MAINTENANCE['RETRY_AFTER']}
+    now = time.monotonic()
+    if _local['expires'] > now:
+        return _local['state']
+    try:
+        state = MaintenanceMode.objects.filter(pk=FLAG_ID).values(
+            'retry_after').first()
+    except DatabaseError:
+        state = _local['state']
+    remember(state, now)
+    return state
+
+
+def remember(state, now=None):
+    with _lock:
+        _local['state'] = state
+        _local['expires'] = (now or time.monotonic()) + \
+            settings.MAINTENANCE['TTL']
+
+
+def enable(retry_after=None):
+    state = {'retry_after': retry_after or
+             settings.MAINTENANCE['RETRY_AFTER']}
+    MaintenanceMode.objects.update_or_create(pk=FLAG_ID, defaults=state)
+    remember(state)
+    return state
+
+
+def disable():
+    MaintenanceMode.objects.filter(pk=FLAG_ID).delete()
+    remember(None)
+
+
+def reset():
+    """Forget the locally cached flag"""
+    with _lock:
+        _local['state'], _local['expires'] = None, 0
+
+
+def is_allowed(path):
+    return path.startswith(tuple(settings.MAINTENANCE['ALLOWED_PATHS']))
+
+
+def unavailable_response(retry_after, body=UNAVAILABLE_BODY):
+    response = HttpResponse(body, status=503,
+                            content_type='application/json')
+    response['Retry-After'] = '%d' % retry_after
+    return response
@@ -0,0 +1,255 @@
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import search, versioning
+from core.models import Tag, Ingredient, Recipe
+
+PASSWORD = 'bench-password'
+
+WORDS = ('tomato', 'basil', 'garlic', 'lentil', 'curry', 'soup', 'salad',
+         'roast', 'pie', 'bread', 'lemon', 'chili', 'rice', 'noodle')
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the API endpoints in process
+
+    Seeds users with recipes, tags and ingredients, drives the real
+    views through the test client and reports latency percentiles,
+    queries per request and throughput per endpoint as JSON. Each
+    request commits on its own as in production, the seeded users are
+    deleted with all their rows at the end unless --keep is given.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--recipes', type=int, default=200,
+                            help='Recipes per user')
+        parser.add_argument('--tags', type=int, default=20,
+                            help='Tags per user')
+        parser.add_argument('--ingredients', type=int, default=50,
+                            help='Ingredients per user')
+        parser.add_argument('--links', type=int, default=3,
+                            help='Tags and ingredients linked per recipe')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the report here')
+        parser.add_argument('--baseline',
+                            help='Report of an earlier run to compare with')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded users and their data')
+
+    def handle(self, *args, **options):
+        if options['links'] > min(options['tags'], options['ingredients']):
+            raise CommandError('--links is larger than --tags or '
+                               '--ingredients')
+        self.random = random.Random(options['seed'])
+        baseline = self.load(options['baseline'])
+
+        with override_settings(**self.bench_settings()):
+            with transaction.atomic():
+                users = self.seed(options)
+            try:
+                results = self.run(users, options)
+            finally:
+                if not options['keep']:
+                    self.clean_up(users)
+
+        report = {
+            'config': {key: options[key] for key in (
+                'users', 'recipes', 'tags', 'ingredients', 'links',
+                'requests', 'seed')},
+            'endpoints': results,
+        }
+        if baseline is not None:
+            report['diff'] = self.compare(baseline, report)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def bench_settings(self):
+        """Settings keeping the test client and repeated logins out of
+        the throttles and budget checks"""
+        throttle = dict(settings.LOGIN_THROTTLE)
+        throttle['IP'] = throttle['EMAIL'] = {'CAPACITY': 10 ** 9,
+                                              'RATE': 10 ** 9}
+        throttle['SHARED_CACHE'] = None
+        return {
+            'ALLOWED_HOSTS': ['*'],
+            'LOGIN_THROTTLE': throttle,
+            'QUERY_BUDGET': dict(settings.QUERY_BUDGET, MODE='off'),
+        }
+
+    def load(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError('Cannot read baseline %s: %s' % (path, exc))
+
+    def seed(self, options):
+        """Create the users and their libraries with bulk inserts"""
+        rand = self.random
+        password = make_password(PASSWORD)
+        # Unique per run, so runs with --keep do not collide
+        run = uuid.uuid4().hex[:8]
+        users = get_user_model().obj.bulk_create([
+            get_user_model()(email='bench%d-%s@fulltummy.com' % (i, run),
+                             name='Bench %d' % i, password=password)
+            for i in range(options['users'])
+        ])
+        for user in users:
+            tags = Tag.objects.bulk_create([
+                Tag(user=user, name='tag %d' % i)
+                for i in range(options['tags'])])
+            ingredients = Ingredient.objects.bulk_create([
+                Ingredient(user=user, name='ingredient %d' % i)
+                for i in range(options['ingredients'])])
+            recipes = Recipe.objects.bulk_create([
+                Recipe(user=user,
+                       title=' '.join(rand.sample(WORDS, 3)),
+                       time_minutes=rand.randint(5, 120),
+                       price=rand.randint(100, 5000) / 100)
+                for _ in range(options['recipes'])])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in rand.sample(tags, options['links'])])
+            Recipe.ingredients.through.objects.bulk_create([
+                Recipe.ingredients.through(recipe=recipe,
+                                           ingredient=ingredient)
+                for recipe in recipes
+                for ingredient in rand.sample(ingredients,
+                                              options['links'])])
+            user.recipe_ids = [recipe.pk for recipe in recipes]
+            search.update_search_vectors(user.recipe_ids)
+        return users
+
+    def clean_up(self, users):
+        """Delete the seeded users, cascading to their libraries and the
+        rows the requests created"""
+        with transaction.atomic(), versioning.deleting(*users):
+            get_user_model().obj.filter(
+                pk__in=[user.pk for user in users]).delete()
+
+    def scenarios(self):
+        """Name, method, url and payload factories of each endpoint"""
+        counter = iter(range(10 ** 9))
+        return [
+            ('user:token', 'post', lambda u: reverse('user:token'),
+             lambda u: {'email': u.email, 'password': PASSWORD}),
+            ('user:me', 'get', lambda u: reverse('user:me'), None),
+            ('recipe:recipe-list', 'get',
+             lambda u: reverse('recipe:recipe-list'), None),
+            ('recipe:recipe-detail', 'get',
+             lambda u: reverse('recipe:recipe-detail',
+                               args=[self.random.choice(u.recipe_ids)]),
+             None),
+            ('recipe:tag-list', 'get',
+             lambda u: reverse('recipe:tag-list'), None),
+            ('recipe:tag-create', 'post',
+             lambda u: reverse('recipe:tag-list'),
+             lambda u: {'name': 'bench tag %d' % next(counter)}),
+            ('recipe:ingredient-list', 'get',
+             lambda u: reverse('recipe:ingredient-list'), None),
+            ('recipe:ingredient-create', 'post',
+             lambda u: reverse('recipe:ingredient-list'),
+             lambda u: {'name': 'bench ingredient %d' % next(counter)}),
+        ]
+
+    def run(self, users, options):
+        clients = []
+        for user in users:
+            client = APIClient()
+            res = client.post(reverse('user:token'),
+                              {'email': user.email, 'password': PASSWORD})
+            if res.status_code != 200:
+                raise CommandError('Login failed: %s' % res.content)
+            client.credentials(HTTP_AUTHORIZATION='Token ' +
+                               res.data['token'])
+            clients.append((user, client))
+
+        results = {}
+        for name, method, url, payload in self.scenarios():
+            for i in range(options['warmup']):
+                self.request(clients[i % len(clients)], method, url, payload)
+            latencies, queries, statuses = [], [], Counter()
+            started = time.perf_counter()
+            for i in range(options['requests']):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    status = self.request(clients[i % len(clients)],
+                                          method, url, payload)
+                    latencies.append(time.perf_counter() - start)
+                queries.append(len(ctx.captured_queries))
+                statuses[status] += 1
+            results[name] = self.summarize(
+                latencies, queries, statuses,
+                time.perf_counter() - started)
+        return results
+
+    def request(self, user_client, method, url, payload):
+        user, client = user_client
+        if method == 'get':
+            return client.get(url(user)).status_code
+        return client.post(url(user), payload(user),
+                           format='json').status_code
+
+    def summarize(self, latencies, queries, statuses, elapsed):
+        latencies = sorted(latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = max(0, math.ceil(p / 100 * len(latencies)) - 1)
+            return round(latencies[index] * 1000, 3)
+
+        return {
+            'requests': len(latencies),
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'queries_per_request': round(sum(queries) /
+                                         max(len(queries), 1), 2),
+            'max_queries': max(queries, default=0),
+            'throughput_rps': round(len(latencies) / elapsed, 1)
+            if elapsed else None,
+            'statuses': {str(code): count
+                         for code, count in sorted(statuses.items())},
+        }
+
+    def compare(self, baseline, report):
+        """Relative change of every metric against the baseline, in %"""
+        diff = {}
+        for name, current in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if not before:
+                continue
+            diff[name] = {
+                key: round((current[key] - before[key]) / before[key] * 100,
+                           1)
+                for key in ('p50_ms', 'p95_ms', 'p99_ms',
+                            'queries_per_request', 'throughput_rps')
+                if before.get(key) and current.get(key) is not None
+            }
+        return diff
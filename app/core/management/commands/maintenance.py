@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core import maintenance
+
+
+class Command(BaseCommand):
+    """Django command to switch maintenance mode on every worker"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('state', choices=['on', 'off', 'status'])
+        parser.add_argument('--retry-after', type=int,
+                            help='Seconds clients are told to wait')
+
+    def handle(self, *args, **options):
+        if options['state'] == 'on':
+            maintenance.enable(options['retry_after'])
+        elif options['state'] == 'off':
+            maintenance.disable()
+
+        maintenance.reset()
+        state = maintenance.get_state()
+        if state is None:
+            self.stdout.write('Maintenance mode is off')
+        else:
+            self.stdout.write('Maintenance mode is on, Retry-After %d' %
+                              state['retry_after'])
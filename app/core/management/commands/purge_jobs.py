@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+class Command(BaseCommand):
+    """Django command to delete finished jobs past their retention in
+    small batches, with any input file left behind, and the input files
+    as old that no job refers to"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Days finished jobs are kept (default: '
+                                 'JOBS["RETENTION"])')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Jobs deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        days = options['days']
+        if days is None:
+            days = settings.JOBS['RETENTION']
+        cutoff = timezone.now() - timedelta(days=days)
+        finished = Job.objects.filter(
+            status__in=[Job.DONE, Job.FAILED], finished_at__lte=cutoff)
+        total = 0
+        while True:
+            rows = list(finished.values_list('pk', 'file')[:batch_size])
+            if not rows:
+                break
+            for _, name in rows:
+                jobs.delete_file(name)
+            Job.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+            time.sleep(options['sleep'])
+
+        # Left by enqueues whose transaction rolled back
+        orphans = 0
+        for name in jobs.orphaned_files(cutoff):
+            jobs.delete_file(name)
+            orphans += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            'Purged %d finished jobs and %d orphaned files' % (total,
+                                                               orphans)))
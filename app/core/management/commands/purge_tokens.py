@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """Django command to delete expired auth tokens in small batches"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Tokens deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        expired = AuthToken.objects.filter(expires_at__lte=now)
+        total = 0
+        while True:
+            keys = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not keys:
+                break
+            AuthToken.objects.filter(pk__in=keys).delete()
+            total += len(keys)
+            if len(keys) < batch_size:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            'Purged %d expired tokens' % total))
@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    """Django command to run queued background jobs until SIGTERM or
+    SIGINT, which let the running jobs finish"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            help='Jobs run at once (default: '
+                                 'JOBS["CONCURRENCY"])')
+        parser.add_argument('--pool', choices=('thread', 'process'),
+                            help='Run the jobs on threads or processes '
+                                 '(default: JOBS["POOL"])')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'],
+                        pool=options['pool'])
+        if not options['burst']:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *args: worker.stop())
+            self.stdout.write('Worker %s running %d %s jobs at a time' % (
+                worker.name, worker.concurrency, worker.pool))
+
+        count = worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS('Ran %d jobs' % count))
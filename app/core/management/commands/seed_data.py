@@ -0,0 +1,308 @@
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core import hashing
+from core.models import Tag, Ingredient, Recipe
+from core.search import SEARCH_CONFIG
+
+WORDS = ('tomato', 'basil', 'garlic', 'lentil', 'curry', 'soup', 'salad',
+         'roast', 'pie', 'bread', 'lemon', 'chili', 'rice', 'noodle',
+         'bean', 'onion', 'ginger', 'mushroom', 'pasta', 'stew')
+
+NULL = '\\N'
+
+CONSTRAINTS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+    WHERE conrelid = %s::regclass AND contype IN ('u', 'f')
+    ORDER BY contype DESC
+"""
+
+# Weighted like core.search.search_vector(), from the names generated
+# along with each recipe
+VECTOR_SQL = """
+    setweight(to_tsvector(%(config)s, title), 'A') ||
+    setweight(to_tsvector(%(config)s, tag_names), 'B') ||
+    setweight(to_tsvector(%(config)s, ingredient_names), 'C')
+"""
+
+INDEXES_SQL = """
+    SELECT i.relname, pg_get_indexdef(i.oid)
+    FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                      WHERE c.conindid = x.indexrelid)
+"""
+
+
+class RowStream(io.RawIOBase):
+    """File reading COPY text lines off a generator of row tuples"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            chunk = [copy_line(row) for _, row in zip(range(1000),
+                                                      self.rows)]
+            if not chunk:
+                break
+            self.buffer += ''.join(chunk).encode()
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def copy_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_line(row):
+    return '\t'.join(copy_value(value) for value in row) + '\n'
+
+
+def seed_name(model, index):
+    return '%s %d' % (model._meta.model_name, index)
+
+
+class Command(BaseCommand):
+    """Django command to load synthetic users and recipes with COPY
+
+    Rows are generated from --seed, so the same options produce the same
+    data on an empty database, and streamed to Postgres table by table
+    in dependency order within one transaction. The unique and foreign
+    key constraints and secondary indexes of the loaded tables are
+    dropped first and rebuilt once the data is in, then the tables are
+    analyzed. Recipes are written once with their search vectors, so
+    the load leaves no dead rows to vacuum.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=1000,
+                            help='Recipes per user')
+        parser.add_argument('--tags', type=int, default=50,
+                            help='Tags per user')
+        parser.add_argument('--ingredients', type=int, default=200,
+                            help='Ingredients per user')
+        parser.add_argument('--links', type=int, default=5,
+                            help='Tags and ingredients linked per recipe')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='seed-password',
+                            help='Password shared by every seeded user')
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='Load into the indexed tables, faster '
+                                 'when adding little to a large database')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['links'] > min(options['tags'], options['ingredients']):
+            raise CommandError('--links is larger than --tags or '
+                               '--ingredients')
+        self.options = options
+        self.connection = connections[options['database']]
+        if self.connection.vendor != 'postgresql':
+            raise CommandError('seed_data needs PostgreSQL')
+        User = get_user_model()
+        models = [User, Tag, Ingredient, Recipe, Recipe.tags.through,
+                  Recipe.ingredients.through]
+
+        with transaction.atomic(using=options['database']), \
+                self.connection.cursor() as cursor:
+            self.cursor = cursor
+            # Check foreign keys row by row instead of queueing millions
+            # of deferred trigger events until the commit
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            for model in models:
+                cursor.execute('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE'
+                               % self.table(model))
+            self.bases = {model: self.max_id(model) for model in models}
+            dropped = {} if options['keep_indexes'] else \
+                self.drop_indexes(models)
+
+            self.copy(User, ['id', 'password', 'is_superuser', 'email',
+                             'name', 'is_active', 'is_staff'],
+                      self.users())
+            self.copy(Tag, ['id', 'user', 'name', 'modified_at'],
+                      self.names(Tag, options['tags']))
+            self.copy(Ingredient, ['id', 'user', 'name', 'modified_at'],
+                      self.names(Ingredient, options['ingredients']))
+            self.copy_recipes(['id', 'user', 'title', 'time_minutes',
+                               'price', 'link', 'modified_at'])
+            self.copy(Recipe.tags.through, ['id', 'recipe', 'tag'],
+                      self.links(Recipe.tags.through, Tag,
+                                 options['tags'], 1))
+            self.copy(Recipe.ingredients.through,
+                      ['id', 'recipe', 'ingredient'],
+                      self.links(Recipe.ingredients.through, Ingredient,
+                                 options['ingredients'], 2))
+
+            for model in models:
+                self.create_indexes(dropped.get(model, ()))
+                cursor.execute('ANALYZE %s' % self.table(model))
+            for sql in self.connection.ops.sequence_reset_sql(
+                    no_style(), models):
+                cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS('Seeded %d users' %
+                                             options['users']))
+
+    def table(self, model):
+        return self.connection.ops.quote_name(model._meta.db_table)
+
+    def columns(self, model, fields):
+        return ', '.join(
+            self.connection.ops.quote_name(model._meta.get_field(f).column)
+            for f in fields)
+
+    def max_id(self, model):
+        self.cursor.execute('SELECT COALESCE(MAX(%s), 0) FROM %s' % (
+            self.connection.ops.quote_name(model._meta.pk.column),
+            self.table(model)))
+        return self.cursor.fetchone()[0]
+
+    def drop_indexes(self, models):
+        """Drop the unique and foreign key constraints and the other
+        indexes except primary keys, returning the statements recreating
+        them per model
+
+        Adding a foreign key back checks all rows in one join instead of
+        one lookup per copied row.
+        """
+        quote = self.connection.ops.quote_name
+        dropped = {}
+        for model in models:
+            table = model._meta.db_table
+            dropped[model] = []
+            self.cursor.execute(CONSTRAINTS_SQL, [table])
+            for name, definition in self.cursor.fetchall():
+                dropped[model].append((name, 'ALTER TABLE %s ADD CONSTRAINT '
+                                       '%s %s' % (quote(table), quote(name),
+                                                  definition)))
+            self.cursor.execute(INDEXES_SQL, [table])
+            dropped[model].extend(self.cursor.fetchall())
+        for model in models:
+            for name, definition in dropped[model]:
+                if definition.startswith('ALTER TABLE'):
+                    self.cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s'
+                                        % (self.table(model), quote(name)))
+                else:
+                    self.cursor.execute('DROP INDEX %s' % quote(name))
+        return dropped
+
+    def create_indexes(self, statements):
+        for name, sql in statements:
+            self.step('Rebuilt %s' % name, lambda: self.cursor.execute(sql))
+
+    def step(self, label, func):
+        start = time.monotonic()
+        func()
+        self.stdout.write('%s in %.1fs' % (label, time.monotonic() - start))
+
+    def copy(self, model, fields, rows):
+        self.copy_into(model._meta.db_table, self.table(model),
+                       self.columns(model, fields), rows)
+
+    def copy_into(self, label, table, columns, rows):
+        sql = 'COPY %s (%s) FROM STDIN' % (table, columns)
+        self.step('Copied %s' % label,
+                  lambda: self.cursor.copy_expert(sql, RowStream(rows),
+                                                  65536))
+
+    def copy_recipes(self, fields):
+        """Copy the recipes and the names of their tags and ingredients
+        to a temporary table and insert them from there with their
+        search vectors
+
+        Updating the vectors after the links are in would leave a dead
+        row behind for every recipe.
+        """
+        columns = self.columns(Recipe, fields)
+        self.cursor.execute(
+            'CREATE TEMPORARY TABLE seed_recipe AS SELECT %s FROM %s '
+            'WITH NO DATA' % (columns, self.table(Recipe)))
+        self.cursor.execute('ALTER TABLE seed_recipe ADD COLUMN tag_names '
+                            'text, ADD COLUMN ingredient_names text')
+        self.copy_into('seed_recipe', 'seed_recipe',
+                       columns + ', tag_names, ingredient_names',
+                       self.recipes())
+        self.step('Inserted %s' % Recipe._meta.db_table,
+                  lambda: self.cursor.execute(
+                      'INSERT INTO %s (%s, search_vector) SELECT %s, %s '
+                      'FROM seed_recipe' % (
+                          self.table(Recipe), columns, columns, VECTOR_SQL),
+                      {'config': SEARCH_CONFIG}))
+        self.cursor.execute('DROP TABLE seed_recipe')
+
+    def user_ids(self):
+        base = self.bases[get_user_model()]
+        return range(base + 1, base + 1 + self.options['users'])
+
+    def users(self):
+        password = hashing.make_password(self.options['password'])
+        for user_id in self.user_ids():
+            yield (user_id, password, False,
+                   'user%d@seed.fulltummy.com' % user_id,
+                   'Seed user %d' % user_id, True, False)
+
+    def names(self, model, per_user):
+        now = timezone.now()
+        pk = self.bases[model]
+        for user_id in self.user_ids():
+            for i in range(per_user):
+                pk += 1
+                yield pk, user_id, seed_name(model, i), now
+
+    def recipes(self):
+        rand = random.Random(self.options['seed'])
+        now = timezone.now()
+        pk = self.bases[Recipe]
+        tags = self.link_offsets(self.options['tags'], 1)
+        ingredients = self.link_offsets(self.options['ingredients'], 2)
+        for user_id in self.user_ids():
+            for _ in range(self.options['recipes']):
+                pk += 1
+                yield (pk, user_id, ' '.join(rand.sample(WORDS, 3)),
+                       rand.randint(5, 180),
+                       '%d.%02d' % (rand.randint(1, 99), rand.randint(0, 99)),
+                       '', now,
+                       ' '.join(seed_name(Tag, i)
+                                for i in sorted(next(tags))),
+                       ' '.join(seed_name(Ingredient, i)
+                                for i in sorted(next(ingredients))))
+
+    def link_offsets(self, per_user, stream):
+        """Offsets among its user's objects of the ones each recipe
+        links, the same sequence for the recipes and the link rows"""
+        rand = random.Random(self.options['seed'] * 3 + stream)
+        for _ in self.user_ids():
+            for _ in range(self.options['recipes']):
+                yield rand.sample(range(per_user), self.options['links'])
+
+    def links(self, through, model, per_user, stream):
+        """Link every recipe to --links distinct objects of its user"""
+        offsets = self.link_offsets(per_user, stream)
+        pk = self.bases[through]
+        recipe_id = self.bases[Recipe]
+        for index, _ in enumerate(self.user_ids()):
+            first = self.bases[model] + index * per_user + 1
+            for _ in range(self.options['recipes']):
+                recipe_id += 1
+                for offset in next(offsets):
+                    pk += 1
+                    yield pk, recipe_id, first + offset
@@ -1,20 +1,82 @@
+import random
 import time
-from django.db import connections
+from django.apps import apps
+from django.db import connections, router
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django comand to pause execution until db is available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Alias to wait for, repeatable '
+                                 '(default: every configured database)')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait before giving up')
+        parser.add_argument('--max-delay', type=float, default=5,
+                            help='Upper bound of the backoff in seconds')
+        parser.add_argument('--warmup', action='store_true',
+                            help='Touch the catalog and model tables once '
+                                 'the database is up')
+
     def handle(self, *args, **options):
         self.stdout.write('Running wait for db command...')
-        db_conn = None
-        while not db_conn:
-            try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Db unavailable, waiting for 1 second...')
-                time.sleep(1)
+        aliases = options['databases'] or list(connections)
+        deadline = time.monotonic() + options['timeout']
+        for alias in aliases:
+            self.wait_for(alias, deadline, options['max_delay'])
+        if options['warmup']:
+            for alias in aliases:
+                self.warmup(alias)
 
         self.stdout.write(self.style.SUCCESS('Database now available!!!'))
+
+    def wait_for(self, alias, deadline, max_delay):
+        """Retry with exponential backoff and jitter until `SELECT 1`
+        succeeds or the deadline passes"""
+        delay = 0.1
+        while True:
+            try:
+                self.ping(alias)
+                return
+            except OperationalError as exc:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        'Database %s unavailable: %s' % (alias, exc))
+                wait = min(random.uniform(delay / 2, delay), remaining)
+                self.stdout.write('Db %s unavailable, waiting %.1f '
+                                  'seconds...' % (alias, wait))
+                time.sleep(wait)
+                delay = min(delay * 2, max_delay)
+
+    def ping(self, alias):
+        """Open a real connection and run a trivial query"""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except OperationalError:
+            connection.close()
+            raise
+
+    def warmup(self, alias):
+        """Read the catalog and one row of every model table
+
+        The first backend after a Postgres restart rebuilds the relation
+        cache init file and loads the table and index pages, this does
+        that work before traffic arrives instead of in the first requests.
+        """
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            tables = set(connection.introspection.table_names(cursor))
+            for model in apps.get_models():
+                table = model._meta.db_table
+                if table in tables and \
+                        router.allow_migrate_model(alias, model):
+                    cursor.execute('SELECT 1 FROM %s LIMIT 1' %
+                                   connection.ops.quote_name(table))
+        self.stdout.write('Warmed up %s' % alias)
@@ -0,0 +1,220 @@
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds':
+        ('Total time spent on the request', LATENCY_BUCKETS),
+    'http_request_db_queries':
+        ('Database queries run for the request', QUERY_BUCKETS),
+    'http_request_db_duration_seconds':
+        ('Time spent waiting on the database', LATENCY_BUCKETS),
+    'http_request_serialize_duration_seconds':
+        ('Time spent serializing and rendering the response',
+         LATENCY_BUCKETS),
+    'http_response_size_bytes':
+        ('Size of the response body', SIZE_BUCKETS),
+}
+
+WORKERS_KEY = 'metrics-workers'
+
+_current = ContextVar('metrics_request', default=None)
+_timing = ContextVar('metrics_timing', default=False)
+
+
+class Registry:
+    """Per process histograms, sharded by thread
+
+    Every thread only ever writes to its own shard, so observing takes
+    no lock. A snapshot reads and sums all shards, and every
+    FLUSH_INTERVAL seconds one thread publishes the snapshot of its
+    process to the shared cache for the other workers to export.
+    Snapshots stay per worker, exported with a `worker` label, so a
+    worker that exits ends its own series instead of making the summed
+    counters go backwards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, route, values):
+        """Record one request, `values` maps histogram names to values"""
+        shard = self.shard()
+        for name, value in values.items():
+            entry = shard.get((name, route))
+            if entry is None:
+                buckets = HISTOGRAMS[name][1]
+                entry = shard[(name, route)] = [0] * (len(buckets) + 1) + [0]
+            entry[bisect_left(HISTOGRAMS[name][1], value)] += 1
+            entry[-1] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for key, entry in list(shard.items()):
+                merge(merged, key, entry)
+        return merged
+
+    def maybe_flush(self):
+        conf = settings.METRICS
+        if time.monotonic() - self._flushed < conf['FLUSH_INTERVAL'] or \
+                not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flushed = time.monotonic()
+            self.flush()
+        finally:
+            self._flush_lock.release()
+
+    def flush(self):
+        conf = settings.METRICS
+        cache = caches[conf['CACHE']]
+        worker = worker_name()
+        cache.set('metrics:%s' % worker, self.snapshot(), conf['WORKER_TTL'])
+        workers = cache.get(WORKERS_KEY) or set()
+        if worker not in workers:
+            cache.set(WORKERS_KEY, workers | {worker}, None)
+
+    def collect(self):
+        """Return the histograms of every worker by worker name, this
+        process's live ones and the ones the others last published"""
+        cache = caches[settings.METRICS['CACHE']]
+        worker = worker_name()
+        workers = cache.get(WORKERS_KEY) or set()
+        published = cache.get_many(['metrics:%s' % other
+                                    for other in workers if other != worker])
+        collected = {key.split(':', 1)[1]: snapshot
+                     for key, snapshot in published.items()}
+        collected[worker] = self.snapshot()
+        expired = workers - set(collected)
+        if expired:
+            # Forget the workers that stopped publishing
+            cache.set(WORKERS_KEY, (cache.get(WORKERS_KEY) or set()) -
+                      expired, None)
+        return collected
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+registry = Registry()
+
+
+def worker_name():
+    """Host and pid, unique across the hosts sharing the cache"""
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def merge(merged, key, entry):
+    current = merged.get(key)
+    if current is None:
+        merged[key] = list(entry)
+    else:
+        for i, value in enumerate(entry):
+            current[i] += value
+
+
+def start_request():
+    """Start collecting the database and serialization time of the
+    request handled by this thread or task"""
+    return _current.set({'queries': 0, 'db': 0.0, 'serialize': 0.0})
+
+
+def finish_request(token):
+    values = _current.get()
+    _current.reset(token)
+    return values
+
+
+def add(field, value):
+    values = _current.get()
+    if values is not None:
+        values[field] += value
+
+
+@contextmanager
+def timing(field):
+    """Add the time spent in the block to `field` of the request,
+    blocks nested in one another are counted once"""
+    if _current.get() is None or _timing.get():
+        yield
+        return
+    token = _timing.set(True)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timing.reset(token)
+        add(field, time.perf_counter() - start)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """Connection execute wrapper timing the queries of the request"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        values = _current.get()
+        if values is not None:
+            values['queries'] += 1
+            values['db'] += time.perf_counter() - start
+
+
+def render_prometheus(collected):
+    """Format the histograms of every worker in the Prometheus text
+    format, one series per route and worker"""
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s histogram' % name)
+        for worker in sorted(collected):
+            merged = collected[worker]
+            routes = sorted(route for metric, route in merged
+                            if metric == name)
+            for route in routes:
+                entry = merged[(name, route)]
+                label = 'route="%s",worker="%s"' % (escape(route),
+                                                    escape(worker))
+                count = 0
+                for bound, observed in zip(buckets + ('+Inf',), entry):
+                    count += observed
+                    lines.append('%s_bucket{%s,le="%s"} %d' %
+                                 (name, label, bound, count))
+                lines.append('%s_sum{%s} %s' % (name, label,
+                                                repr(entry[-1])))
+                lines.append('%s_count{%s} %d' % (name, label, count))
+    return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
@@ -1,10 +1,114 @@
+import time
+from contextlib import ExitStack
+
 from django.conf import settings
-from django.utils.deprecation import MiddlewareMixin
+from django.db import connections
+
+from core import maintenance, metrics, shedding
+
+
+class MaintenanceModeMiddleware:
+    """Answer with a 503 while maintenance mode is on
+
+    Installed first so a request in maintenance never reaches sessions,
+    CSRF, authentication or a view. Paths in
+    MAINTENANCE['ALLOWED_PATHS'] are still served.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = maintenance.get_state()
+        if state is not None and not maintenance.is_allowed(
+                request.path_info):
+            return maintenance.unavailable_response(state['retry_after'])
+        return self.get_response(request)
+
+
+class LoadSheddingMiddleware:
+    """Answer with a 503 when a route class is over its adaptive limit
+
+    Installed right after MaintenanceModeMiddleware so shed requests
+    cost no session, authentication or database work. The limits of
+    the worker are reported by core.views.LoadSheddingStatsView.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.LOAD_SHEDDING['ENABLED']:
+            return self.get_response(request)
+        shedder = shedding.get_load_shedder()
+        name = shedder.classify(request)
+        if name is None:
+            return self.get_response(request)
+        if not shedder.acquire(name):
+            return maintenance.unavailable_response(
+                settings.LOAD_SHEDDING['RETRY_AFTER'],
+                body=shedding.OVERLOADED_BODY)
+
+        start = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            shedder.release(name, time.monotonic() - start)
+
+
+class MetricsMiddleware:
+    """Record latency, queries, serialization time and response size
+    per resolved route into core.metrics
+
+    Rendering of DRF responses happens after the view returns, its time
+    is added to the serialization time of the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+
+        token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            values = metrics.finish_request(token)
+        elapsed = time.perf_counter() - start
 
-from core.views import MaintenanceModeView
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        observed = {
+            'http_request_duration_seconds': elapsed,
+            'http_request_db_queries': values['queries'],
+            'http_request_db_duration_seconds': values['db'],
+            'http_request_serialize_duration_seconds': values['serialize'],
+        }
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                route, response.streaming_content)
+        else:
+            observed['http_response_size_bytes'] = len(response.content)
+        metrics.registry.observe(route, observed)
+        return response
 
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: metrics.add('serialize',
+                                         time.perf_counter() - start))
+        return response
 
-class MaintenanceModeMiddleware(MiddlewareMixin):
-    def process_view(self, request, *args, **kwargs):
-        if settings.MAINTENANCE_MODE:
-            return MaintenanceModeView(request)
+    def measure_stream(self, route, content):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        metrics.registry.observe(route, {'http_response_size_bytes': size})
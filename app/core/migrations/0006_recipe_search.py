@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:26
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def linked_names(through, field):
+    return Subquery(
+        through.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe')
+        .annotate(names=StringAgg('%s__name' % field, ' '))
+        .values('names')
+    )
+
+
+def fill_search_vectors(apps, schema_editor):
+    # The vector as of this migration, core.search may change later
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english') +
+        SearchVector(linked_names(Recipe.tags.through, 'tag'),
+                     weight='B', config='english') +
+        SearchVector(linked_names(Recipe.ingredients.through, 'ingredient'),
+                     weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_modification_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ),
+    ]
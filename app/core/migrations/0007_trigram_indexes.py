@@ -0,0 +1,47 @@
+from django.db import DatabaseError, migrations, transaction
+
+TRIGRAM_INDEXES = (
+    ('core_tag', 'tag_name_trgm_idx'),
+    ('core_ingredient', 'ingredient_name_trgm_idx'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """GIN trigram indexes for the autocomplete lookups
+
+    Skipped on servers without the pg_trgm contrib module, or when the
+    role may not install it (a superuser is needed before PostgreSQL
+    13), the lookups then fall back to scanning the user's rows.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    try:
+        # A failed statement aborts the migration's transaction unless
+        # it ran in a savepoint
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for table, name in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON %s USING gin (name gin_trgm_ops)'
+            % (name, table))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    for _, name in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+MERGE_DUPLICATES = """
+CREATE TEMPORARY TABLE {model}_duplicates ON COMMIT DROP AS
+SELECT id, keep FROM (
+    SELECT id, min(id) OVER (PARTITION BY user_id, lower(name)) AS keep
+    FROM core_{model}
+) ranked WHERE id <> keep;
+
+INSERT INTO core_recipe_{model}s (recipe_id, {model}_id)
+SELECT DISTINCT link.recipe_id, duplicate.keep
+FROM core_recipe_{model}s link
+JOIN {model}_duplicates duplicate ON link.{model}_id = duplicate.id
+ON CONFLICT DO NOTHING;
+
+DELETE FROM core_recipe_{model}s
+WHERE {model}_id IN (SELECT id FROM {model}_duplicates);
+
+DELETE FROM core_{model} WHERE id IN (SELECT id FROM {model}_duplicates);
+
+-- Run the deferred foreign key checks, an index can not be built with
+-- trigger events pending on the table
+SET CONSTRAINTS ALL IMMEDIATE;
+
+CREATE UNIQUE INDEX {model}_user_lower_name_uniq
+ON core_{model} (user_id, lower(name));
+"""
+
+DROP_INDEX = 'DROP INDEX IF EXISTS {model}_user_lower_name_uniq;'
+
+
+class Migration(migrations.Migration):
+    """Make tag and ingredient names unique per user ignoring case
+
+    Duplicates are merged into the oldest row, recipes linking a removed
+    duplicate are linked to the kept row instead.
+    """
+
+    dependencies = [
+        ('core', '0007_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES.format(model=model),
+                          DROP_INDEX.format(model=model))
+        for model in ('tag', 'ingredient')
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceMode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retry_after', models.PositiveIntegerField()),
+                ('enabled_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_maintenance_mode'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='job',
+            name='attachment',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+import binascii
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+
+from core import hashing
 
 # Create your models here.
 
@@ -38,12 +47,148 @@ class User(AbstractBaseUser, PermissionsMixin):
     obj = UserManager()
     USERNAME_FIELD = 'email'
 
+    def set_password(self, raw_password):
+        """Hash on the bounded pool of core.hashing"""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Verify on the bounded pool, upgrading outdated hashes"""
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        return hashing.check_password(raw_password, self.password, setter)
+
+
+def generate_token_key():
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+def token_expiry():
+    return timezone.now() + timedelta(seconds=settings.TOKEN_TTL)
+
+
+class AuthTokenManager(models.Manager):
+
+    def issue(self, user):
+        """Return a token for the user, rotating to a new key once the
+        latest one has used up half of its lifetime"""
+        token = self.filter(user=user).order_by('-expires_at').first()
+        half_life = timedelta(seconds=settings.TOKEN_TTL / 2)
+        if token and token.expires_at - timezone.now() > half_life:
+            return token
+
+        return self.create(user=user)
+
+
+class AuthToken(models.Model):
+    """Expiring authorization token, a user may hold several"""
+    key = models.CharField(max_length=40, primary_key=True,
+                           default=generate_token_key)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='auth_tokens',
+                             on_delete=models.CASCADE,)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=token_expiry, db_index=True)
+
+    objects = AuthTokenManager()
+
+    def is_expired(self, now=None):
+        return self.expires_at <= (now or timezone.now())
+
+    def needs_refresh(self, now=None):
+        """True when a sliding token is past half of its lifetime"""
+        remaining = self.expires_at - (now or timezone.now())
+        return remaining < timedelta(seconds=settings.TOKEN_TTL / 2)
+
+    def refresh(self):
+        """Slide the expiry forward by a full lifetime"""
+        self.expires_at = token_expiry()
+        AuthToken.objects.filter(pk=self.pk).update(
+            expires_at=self.expires_at)
+
+    def __str__(self):
+        return self.key
+
+
+class NamedObjectManager(models.Manager):
+    """Manager of the per user, case insensitively unique tag and
+    ingredient names"""
+
+    upsert_sql = """
+        WITH input (name, position) AS (
+            SELECT * FROM unnest(%(names)s::text[]) WITH ORDINALITY
+        ), inserted AS (
+            INSERT INTO {table} ({user}, {name}, {modified})
+            SELECT DISTINCT ON (lower(name)) %(user)s, name, now()
+            FROM input ORDER BY lower(name), position
+            ON CONFLICT ({user}, lower({name})) DO NOTHING
+            RETURNING {pk}, {name}
+        )
+        SELECT input.position,
+               coalesce(inserted.{pk}, existing.{pk}),
+               coalesce(inserted.{name}, existing.{name}),
+               inserted.{pk} IS NOT NULL
+        FROM input
+        LEFT JOIN inserted ON lower(inserted.{name}) = lower(input.name)
+        LEFT JOIN {table} existing ON existing.{user} = %(user)s
+            AND lower(existing.{name}) = lower(input.name)
+        ORDER BY input.position
+    """
+
+    def upsert(self, user, names):
+        """Return `(id, name, created)` of each name, creating the missing
+        ones, in one statement
+
+        Rows committed by a concurrent upsert after the statement started
+        are not visible to it, the names left without an id are looked up
+        again by a second statement.
+        """
+        results = [None] * len(names)
+        pending = list(range(len(names)))
+        for _ in range(2):
+            rows = self._upsert(user, [names[i] for i in pending])
+            for position, pk, name, created in rows:
+                if pk is not None:
+                    results[pending[position - 1]] = (pk, name, created)
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+        return results
+
+    def _upsert(self, user, names):
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        sql = self.upsert_sql.format(
+            table=quote(opts.db_table),
+            pk=quote(opts.pk.column),
+            user=quote(opts.get_field('user').column),
+            name=quote(opts.get_field('name').column),
+            modified=quote(opts.get_field('modified_at').column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'names': list(names), 'user': user.pk})
+            return cursor.fetchall()
+
 
 class Tag(models.Model):
     """Tags that will be user for a recipe"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE,)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    # Names are unique per user ignoring case, the (user, lower(name))
+    # index is created by migration 0008
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'],
+                         name='tag_user_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -54,6 +199,15 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE,)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'],
+                         name='ingredient_user_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -71,7 +225,171 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
+    modified_at = models.DateTimeField(auto_now=True)
+    # Maintained from the title, tag and ingredient names, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
     # image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='recipe_user_id_idx'),
+            models.Index(fields=['user', 'price'],
+                         name='recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes'],
+                         name='recipe_user_time_idx'),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets saves skip reindexing when the title did not change
+        instance._loaded_title = instance.__dict__.get('title')
+        return instance
+
     def __str__(self):
         return self.title
+
+
+class CollectionVersionManager(models.Manager):
+
+    def bump(self, user_id, collection):
+        """Increment the version of one of the user's collections"""
+        now = timezone.now()
+        versions = self.filter(user_id=user_id, collection=collection)
+        if versions.update(version=models.F('version') + 1, modified_at=now):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, collection=collection,
+                            version=1, modified_at=now)
+        except IntegrityError:
+            versions.update(version=models.F('version') + 1, modified_at=now)
+
+
+class CollectionVersion(models.Model):
+    """Change counter of one of a user's collections (recipes, tags...)
+    bumped on every write so unchanged lists can be answered with 304"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,)
+    collection = models.CharField(max_length=32)
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    objects = CollectionVersionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'collection'],
+                                    name='collection_version_user_unique'),
+        ]
+
+    def __str__(self):
+        return '%s v%d' % (self.collection, self.version)
+
+
+class RecipeImport(models.Model):
+    """Progress of a recipe import, advanced in the transaction of every
+    batch so an interrupted import resumes after the last one written"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,)
+    key = models.CharField(max_length=255)
+    rows_done = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'],
+                                    name='recipe_import_user_key_unique'),
+        ]
+
+    def __str__(self):
+        return '%s: %d rows' % (self.key, self.rows_done)
+
+
+class JobManager(models.Manager):
+
+    dequeue_sql = """
+        UPDATE {table}
+        SET status = 'running', attempts = attempts + 1,
+            started_at = %(now)s,
+            run_at = %(now)s + %(lease)s * interval '1 second',
+            worker = %(worker)s
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE status IN ('queued', 'running') AND run_at <= %(now)s
+            ORDER BY run_at, id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    """
+
+    def dequeue(self, worker, limit, lease):
+        """Claim up to `limit` due jobs for `worker` and return their ids
+
+        The rows locked by a concurrent dequeue are skipped instead of
+        waited for. A claimed job's `run_at` becomes the end of its lease,
+        a running job whose lease ran out is claimed again. Times come
+        from the application clock like the ones jobs are queued with.
+        """
+        connection = connections[self.db]
+        sql = self.dequeue_sql.format(
+            table=connection.ops.quote_name(self.model._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'worker': worker, 'limit': limit,
+                                 'lease': lease, 'now': timezone.now()})
+            return sorted(row[0] for row in cursor.fetchall())
+
+
+class Job(models.Model):
+    """Background work run by `manage.py run_worker`, see core.jobs"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'),
+                      (DONE, 'Done'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
+                             blank=True, on_delete=models.SET_NULL,)
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # Storage name of an input file too large for the payload, such as
+    # an upload, see core.jobs.get_storage
+    file = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    # When a queued job is due, or the lease of a running one ends
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='job_pending_idx',
+                         condition=models.Q(status__in=['queued',
+                                                        'running'])),
+        ]
+
+    def __str__(self):
+        return '%s #%d (%s)' % (self.task, self.pk, self.status)
+
+
+class MaintenanceMode(models.Model):
+    """Runtime maintenance flag shared by every worker through the
+    database, on while its single row exists, see core.maintenance"""
+    retry_after = models.PositiveIntegerField()
+    enabled_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'Maintenance, Retry-After %d' % self.retry_after
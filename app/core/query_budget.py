@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core.exceptions import QueryBudgetExceeded
+
+logger = logging.getLogger('core.query_budget')
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Query plumbing that is never the call site worth reporting
+IGNORED_FILES = (
+    os.path.abspath(__file__),
+    os.path.join(APP_DIR, 'core', 'metrics.py'),
+    os.path.join(APP_DIR, 'core', 'db', ''),
+)
+
+_NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+class QueryBudget:
+    """Most queries and database milliseconds one view action may use"""
+
+    def __init__(self, queries=None, db_ms=None):
+        self.queries = queries
+        self.db_ms = db_ms
+
+    def __repr__(self):
+        return 'QueryBudget(queries=%r, db_ms=%r)' % (self.queries,
+                                                      self.db_ms)
+
+
+def fingerprint(sql):
+    """Return the SQL with its values and IN lists collapsed and a short
+    hash of it, so repeats of one query group together"""
+    for pattern, replacement in _NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    sql = sql.strip()
+    return hashlib.md5(sql.encode()).hexdigest()[:8], sql
+
+
+def call_site(depth=2):
+    """Return the innermost frames of the app code running a query"""
+    sites = []
+    frame = sys._getframe(2)
+    while frame is not None and len(sites) < depth:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and \
+                'site-packages' not in filename and \
+                not filename.startswith(IGNORED_FILES):
+            sites.append('%s:%d in %s' % (
+                os.path.relpath(filename, APP_DIR), frame.f_lineno,
+                frame.f_code.co_name))
+        frame = frame.f_back
+    return ' < '.join(sites) or '<unknown>'
+
+
+class QueryRecorder:
+    """Connection execute wrapper keeping the SQL, time and call site of
+    every query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start,
+                                 call_site()))
+
+    @property
+    def db_ms(self):
+        return sum(duration for _, duration, _ in self.queries) * 1000
+
+    def group(self):
+        """Group the queries by fingerprint, most repeated first"""
+        groups = OrderedDict()
+        for sql, duration, site in self.queries:
+            key, normalized = fingerprint(sql)
+            group = groups.setdefault(key, {
+                'fingerprint': key, 'sql': normalized, 'count': 0,
+                'ms': 0.0, 'sites': []})
+            group['count'] += 1
+            group['ms'] += duration * 1000
+            if site not in group['sites']:
+                group['sites'].append(site)
+        return sorted(groups.values(), key=lambda g: -g['count'])
+
+
+def format_report(report):
+    lines = ['%(view)s ran %(queries)d queries in %(db_ms).1f ms, '
+             'budget %(budget)r' % report]
+    for group in report['fingerprints']:
+        lines.append('  %3dx %7.1f ms [%s] %s' % (
+            group['count'], group['ms'], group['fingerprint'],
+            group['sql']))
+        for site in group['sites']:
+            lines.append('                at %s' % site)
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """View mixin checking the queries of every action against a budget
+
+    Views declare `query_budgets`, a dict of action name to QueryBudget,
+    actions missing there get QUERY_BUDGET['DEFAULT']. In the `raise`
+    mode of dev and tests running more queries than the budget raises
+    QueryBudgetExceeded, in `log` mode it is logged, and in `sample`
+    mode only a SAMPLE_RATE share of the requests is checked and logged.
+    Database time depends on the machine, going over `db_ms` is only
+    ever logged. Each report groups the SQL by normalized fingerprint
+    with the call sites that ran it.
+    """
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        conf = settings.QUERY_BUDGET
+        mode = conf['MODE']
+        if mode == 'off' or (mode == 'sample' and
+                             random.random() >= conf['SAMPLE_RATE']):
+            return super().dispatch(request, *args, **kwargs)
+
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = super().dispatch(request, *args, **kwargs)
+
+        self.check_query_budget(request, recorder, mode)
+        return response
+
+    def get_query_budget(self):
+        action = getattr(self, 'action', None) or self.request.method.lower()
+        budget = self.query_budgets.get(action)
+        if budget is None:
+            default = settings.QUERY_BUDGET['DEFAULT']
+            budget = QueryBudget(default['QUERIES'], default['DB_MS'])
+        return action, budget
+
+    def check_query_budget(self, request, recorder, mode):
+        action, budget = self.get_query_budget()
+        count, db_ms = len(recorder.queries), recorder.db_ms
+        over_count = budget.queries is not None and count > budget.queries
+        over_time = budget.db_ms is not None and db_ms > budget.db_ms
+        if not (over_count or over_time):
+            return
+
+        match = request.resolver_match
+        report = {
+            'view': '%s (%s)' % (match.view_name if match else
+                                 type(self).__name__, action),
+            'queries': count,
+            'db_ms': db_ms,
+            'budget': budget,
+            'fingerprints': recorder.group(),
+        }
+        if over_count and mode == 'raise':
+            raise QueryBudgetExceeded(format_report(report), report)
+        logger.warning('Query budget exceeded: %s', format_report(report),
+                       extra={'query_budget': report})
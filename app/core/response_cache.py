@@ -0,0 +1,81 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+class CacheStats:
+    """Per process hit and miss counters of the response cache"""
+    fields = ('hits', 'misses', 'stores', 'oversized')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field):
+        with self._lock:
+            self._counts[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.fields, 0)
+
+
+stats = CacheStats()
+
+
+class ResponseCacheMixin:
+    """Viewset mixin caching the rendered bytes of list responses
+
+    Entries are keyed by user, endpoint, host and query string plus the
+    collection version from `ConditionalGetMixin`. The version is bumped by
+    the model signals on every write, so stale entries are never read
+    again and age out of the cache. Enabled with RESPONSE_CACHE.
+    """
+
+    def list(self, request, *args, **kwargs):
+        conf = settings.RESPONSE_CACHE
+        if not conf['ENABLED']:
+            return super().list(request, *args, **kwargs)
+
+        cache = caches[conf['CACHE']]
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            stats.incr('hits')
+            content_type, content = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        stats.incr('misses')
+        response = super().list(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+
+        def store(rendered):
+            if rendered.status_code != 200:
+                return
+            if len(rendered.content) > conf['MAX_BYTES']:
+                stats.incr('oversized')
+                return
+            cache.set(key, (rendered['Content-Type'], rendered.content),
+                      conf['TIMEOUT'])
+            stats.incr('stores')
+
+        response.add_post_render_callback(store)
+        return response
+
+    def get_response_cache_key(self, request):
+        etag, _ = self.get_validators(request)
+        variant = '|'.join([
+            self.basename, request.get_host(), request.get_full_path(),
+            request.accepted_renderer.format, etag,
+        ])
+        return 'response:%s:%s' % (
+            request.user.pk, hashlib.md5(variant.encode()).hexdigest())
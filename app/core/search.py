@@ -0,0 +1,92 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db.models import OuterRef, Subquery
+
+from core.models import Recipe
+
+SEARCH_CONFIG = 'english'
+
+_local = threading.local()
+
+
+def linked_names(through, field):
+    """Space separated names of the rows a recipe links through `through`"""
+    return Subquery(
+        through.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe')
+        .annotate(names=StringAgg('%s__name' % field, ' '))
+        .values('names')
+    )
+
+
+def search_vector():
+    """Title weighted above tag names, weighted above ingredient names"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector(linked_names(Recipe.tags.through, 'tag'),
+                     weight='B', config=SEARCH_CONFIG) +
+        SearchVector(linked_names(Recipe.ingredients.through,
+                                  'ingredient'),
+                     weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """Recompute the stored search vector of the given recipes"""
+    recipe_ids = set(recipe_ids)
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+    elif recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_vector())
+
+
+def linked_recipe_ids(model, pks):
+    """Ids of the recipes linking any of the given tags or ingredients"""
+    field = model._meta.model_name
+    through = Recipe._meta.get_field('%ss' % field).remote_field.through
+    return set(through.objects.filter(**{'%s__in' % field: pks})
+               .values_list('recipe_id', flat=True))
+
+
+@contextmanager
+def unlinking(model, pks):
+    """Reindex the recipes linking the given tags or ingredients once the
+    block deleted them, collected with one query for the whole batch
+    instead of one per deleted row"""
+    collected = unlinked()
+    pks = {(model, pk) for pk in pks} - collected
+    recipe_ids = linked_recipe_ids(model, [pk for _, pk in pks])
+    collected.update(pks)
+    try:
+        yield
+    finally:
+        collected.difference_update(pks)
+    update_search_vectors(recipe_ids)
+
+
+def unlinked():
+    """`(model, pk)` of the tags and ingredients whose linked recipes an
+    `unlinking()` block of this thread already collected"""
+    if not hasattr(_local, 'unlinked'):
+        _local.unlinked = set()
+    return _local.unlinked
+
+
+@contextmanager
+def deferred_updates():
+    """Recompute each touched vector once at the end of a bulk write"""
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+
+    _local.pending = set()
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        update_search_vectors(pending)
@@ -0,0 +1,105 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from core import metrics
+from core.models import Job
+
+
+class EagerLoadingMixin:
+    """Serializer mixin declaring the relations its representation reads
+
+    Views pass their queryset through `setup_eager_loading` so the related
+    rows are fetched up front instead of once per serialized object.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Return the queryset with the declared relations loaded"""
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+
+        return queryset
+
+    @classmethod
+    def load_related(cls, instances):
+        """Load the declared relations onto already fetched instances"""
+        prefetch_related_objects(instances, *cls.select_related_fields,
+                                 *cls.prefetch_related_fields)
+
+
+class MeasuredSerializerMixin:
+    """Serializer mixin counting its representation towards the
+    serialization time of the request metrics"""
+
+    def to_representation(self, instance):
+        with metrics.timing('serialize'):
+            return super().to_representation(instance)
+
+
+class UserOwnedManyRelatedField(serializers.ManyRelatedField):
+    """List of related ids resolved with a single IN query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = list(dict.fromkeys(self.child_relation.to_pk(item)
+                                 for item in data))
+        found = self.child_relation.get_queryset().in_bulk(pks)
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            message = self.child_relation.error_messages['does_not_exist']
+            raise serializers.ValidationError(
+                [message.format(pk_value=pk) for pk in missing])
+
+        return [found[pk] for pk in pks]
+
+
+class UserOwnedRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field accepting only rows owned by the request user
+
+    With `many=True` every submitted id is checked at once, ids of other
+    users are reported as not existing.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return UserOwnedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        queryset = super().get_queryset()
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Status of a background job"""
+
+    class Meta:
+        model = Job
+        fields = ('id', 'task', 'status', 'attempts', 'max_attempts',
+                  'run_at', 'result', 'error', 'created_at', 'started_at',
+                  'finished_at')
+        read_only_fields = fields
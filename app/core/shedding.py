@@ -0,0 +1,130 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Rendered once like the maintenance body
+OVERLOADED_BODY = json.dumps('Service overloaded, retry later').encode()
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AdaptiveLimit:
+    """Concurrency limit of one route class adapted from its latency
+
+    The limit follows the gradient between the lowest latency seen
+    recently and the smoothed current latency: while requests are as
+    fast as the baseline it grows by about its square root per sample,
+    once they queue up behind a slow database it shrinks in proportion
+    to the slowdown, by at most half per sample. The baseline is
+    forgotten every WINDOW samples so a lasting change is learnt.
+    """
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.limit = float(conf['INITIAL_LIMIT'])
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.samples = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @property
+    def saturated(self):
+        return self.in_flight >= int(self.limit)
+
+    def update(self, elapsed):
+        conf = self.conf
+        self.latency = elapsed if self.latency is None else \
+            self.latency + conf['LATENCY_SMOOTHING'] * (elapsed -
+                                                        self.latency)
+        self.samples += 1
+        if self.samples % conf['WINDOW'] == 0:
+            self.min_latency = self.latency
+        elif self.min_latency is None or elapsed < self.min_latency:
+            self.min_latency = elapsed
+
+        gradient = max(0.5, min(1.0, conf['TOLERANCE'] * self.min_latency /
+                                max(self.latency, 1e-6)))
+        if gradient == 1.0 and self.in_flight < self.limit / 2:
+            # Fast because idle, not because the limit is too low
+            return
+        limit = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit + conf['LIMIT_SMOOTHING'] * (limit - self.limit)
+        self.limit = max(conf['MIN_LIMIT'], min(conf['MAX_LIMIT'], limit))
+
+    def snapshot(self):
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'latency_ms': round(self.latency * 1000, 1)
+            if self.latency is not None else None,
+            'min_latency_ms': round(self.min_latency * 1000, 1)
+            if self.min_latency is not None else None,
+            'admitted': self.admitted,
+            'shed': self.shed,
+        }
+
+
+class LoadShedder:
+    """Admit or shed requests per route class
+
+    A request is shed only when its own class is at its limit. A burst
+    of logins, slowed down by password hashing, then sheds logins and
+    never the reads and writes of signed in users.
+    """
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.classes = OrderedDict((name, AdaptiveLimit(conf))
+                                   for name in conf['CLASSES'])
+        self._lock = threading.Lock()
+
+    def classify(self, request):
+        path = request.path_info
+        if path.startswith(tuple(self.conf['EXEMPT_PATHS'])):
+            return None
+        if path.startswith(tuple(self.conf['AUTH_PATHS'])):
+            return 'auth'
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def acquire(self, name):
+        """Take a slot of the class, returning False to shed"""
+        with self._lock:
+            limit = self.classes[name]
+            if limit.saturated:
+                limit.shed += 1
+                return False
+            limit.in_flight += 1
+            limit.admitted += 1
+            return True
+
+    def release(self, name, elapsed):
+        with self._lock:
+            limit = self.classes[name]
+            limit.in_flight -= 1
+            limit.update(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return OrderedDict((name, limit.snapshot())
+                               for name, limit in self.classes.items())
+
+
+_shedder = None
+
+
+def get_load_shedder():
+    """Return the process wide shedder built from LOAD_SHEDDING"""
+    global _shedder
+    if _shedder is None:
+        _shedder = LoadShedder(settings.LOAD_SHEDDING)
+    return _shedder
+
+
+def reset_load_shedder():
+    global _shedder
+    _shedder = None
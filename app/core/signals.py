@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+
+from core import authentication, hashing, maintenance, search, \
+    shedding, throttling, versioning
+from core.models import AuthToken, Tag, Ingredient, Recipe
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a deleted token from the auth cache"""
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Re-read the user on the next request after a deactivation,
+    password or profile change"""
+    if not created:
+        authentication.invalidate_user(instance)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def start_user_delete(sender, instance, **kwargs):
+    # The cascade runs before the user row goes, its bumps would write
+    # version rows the user's delete then violates
+    versioning.deleting_users().add(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def finish_user_delete(sender, instance, **kwargs):
+    versioning.deleting_users().discard(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def bump_saved_collection(sender, instance, **kwargs):
+    versioning.bump(instance.user_id, sender)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_deleted_attr_collections(sender, instance, **kwargs):
+    # Deleting a tag or ingredient also unlinks it from recipes
+    versioning.bump(instance.user_id, sender, Recipe)
+
+
+@receiver(post_delete, sender=Recipe)
+def bump_deleted_recipe_collections(sender, instance, **kwargs):
+    # Unlinked tags and ingredients may drop out of assigned_only lists
+    versioning.bump(instance.user_id, Recipe, Tag, Ingredient)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_linked_collections(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        related = Tag if sender is Recipe.tags.through else Ingredient
+        versioning.bump(instance.user_id, Recipe, related)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and 'title' not in update_fields:
+        return
+    if getattr(instance, '_loaded_title', None) != instance.title:
+        search.update_search_vectors([instance.pk])
+        instance._loaded_title = instance.title
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_renamed_attr_search(sender, instance, created, update_fields,
+                               **kwargs):
+    """Reindex the recipes linking a renamed tag or ingredient"""
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    recipe_ids = search.linked_recipe_ids(sender, [instance.pk])
+    if recipe_ids:
+        search.update_search_vectors(recipe_ids)
+        versioning.bump(instance.user_id, Recipe)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_unlinked_recipes(sender, instance, **kwargs):
+    if (sender, instance.pk) in search.unlinked():
+        return
+    # The links are gone by post_delete, remember who to reindex
+    instance._linked_recipe_ids = search.linked_recipe_ids(
+        sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_unlinked_search(sender, instance, **kwargs):
+    search.update_search_vectors(
+        getattr(instance, '_linked_recipe_ids', ()))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_linked_search(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._linked_recipe_ids = search.linked_recipe_ids(
+            type(instance), [instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        search.update_search_vectors(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        search.update_search_vectors(
+            getattr(instance, '_linked_recipe_ids', ())
+            if reverse else [instance.pk])
+
+
+@receiver(setting_changed)
+def reset_caches(setting, **kwargs):
+    if setting == 'TOKEN_AUTH_CACHE':
+        authentication.reset_token_cache()
+    elif setting == 'PASSWORD_HASHING':
+        hashing.reset_hashing_pool()
+    elif setting == 'LOGIN_THROTTLE':
+        throttling.reset_login_guard()
+    elif setting == 'MAINTENANCE':
+        maintenance.reset()
+    elif setting == 'LOAD_SHEDDING':
+        shedding.reset_load_shedder()
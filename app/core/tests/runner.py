@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Run the tests with the maintenance flag trusted for the whole run
+
+    A re-read of the flag row once its TTL runs out would add a query to
+    whichever request happens to come next, failing the tests counting
+    queries at random. The tests forget the flag with
+    `maintenance.reset()` instead.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.maintenance = override_settings(
+            MAINTENANCE={**settings.MAINTENANCE, 'TTL': 24 * 3600})
+        self.maintenance.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.maintenance.disable()
+        super().teardown_test_environment(**kwargs)
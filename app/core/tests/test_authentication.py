@@ -0,0 +1,210 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, get_token_cache
+from core.models import AuthToken
+
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+SHARED_TOKEN_CACHE = {'MAX_SIZE': 100, 'TTL': 30, 'SHARED_CACHE': 'shared'}
+
+
+def token_queries(ctx):
+    """Return the captured queries that touched the token table"""
+    return [q for q in ctx.captured_queries
+            if AuthToken._meta.db_table in q['sql']]
+
+
+class TokenCacheTests(TestCase):
+    """Test the in-process token LRU"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows past its max size"""
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+    def test_entries_expire(self):
+        """Test entries are dropped once their TTL runs out"""
+        cache = TokenCache(max_size=2, ttl=10)
+        with patch('time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating API requests through the token cache"""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = get_user_model().obj.create_user(
+            email='cached_auth@fulltummy.com',
+            password='mypassword'
+        )
+        self.token = AuthToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_looked_up_once(self):
+        """Test repeated requests do not query the token table"""
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_queries(ctx), [])
+
+    def test_invalid_token_rejected(self):
+        """Test unknown tokens are still rejected"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """Test a deleted token stops authenticating immediately"""
+        self.client.get(TAGS_URL)
+        self.token.delete()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """Test a deactivated user stops authenticating immediately"""
+        self.client.get(TAGS_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidated(self):
+        """Test changing the password drops the cached user"""
+        self.client.get(ME_URL)
+        self.assertEqual(len(get_token_cache()), 1)
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(get_token_cache()), 0)
+
+    def test_profile_change_visible(self):
+        """Test the next request sees the updated user"""
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'new name'})
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new name')
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED_TOKEN_CACHE)
+    def test_shared_cache_tier(self):
+        """Test a worker with a cold local cache uses the shared tier"""
+        caches['shared'].clear()
+        self.client.get(TAGS_URL)
+        get_token_cache().clear()
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_queries(ctx), [])
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED_TOKEN_CACHE)
+    def test_shared_cache_invalidated(self):
+        """Test deleting a token removes it from the shared tier"""
+        caches['shared'].clear()
+        self.client.get(TAGS_URL)
+        self.token.delete()
+        get_token_cache().clear()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ExpiringTokenTests(TestCase):
+    """Test authenticating with expiring tokens"""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = get_user_model().obj.create_user(
+            email='expiring_token@fulltummy.com',
+            password='mypassword'
+        )
+        self.client = APIClient()
+
+    def authenticate(self, expires_in):
+        token = AuthToken.objects.create(
+            user=self.user,
+            expires_at=timezone.now() + timedelta(seconds=expires_in)
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        return token
+
+    def test_expired_token_rejected(self):
+        """Test an expired token is rejected with the same single query"""
+        self.authenticate(expires_in=-1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_cached_token_expires(self):
+        """Test a cached token stops working once it expires"""
+        self.authenticate(expires_in=60)
+        self.client.get(TAGS_URL)
+
+        later = timezone.now() + timedelta(seconds=61)
+        with patch('django.utils.timezone.now', return_value=later):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_TTL=100, TOKEN_SLIDING_REFRESH=True)
+    def test_sliding_refresh(self):
+        """Test a sliding token is extended once half of it is used"""
+        token = self.authenticate(expires_in=40)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        token.refresh_from_db()
+        self.assertGreater(token.expires_at,
+                           timezone.now() + timedelta(seconds=90))
+
+    @override_settings(TOKEN_TTL=100, TOKEN_SLIDING_REFRESH=False)
+    def test_no_refresh_by_default(self):
+        """Test tokens keep their expiry without sliding refresh"""
+        token = self.authenticate(expires_in=40)
+        expires_at = token.expires_at
+
+        self.client.get(TAGS_URL)
+
+        token.refresh_from_db()
+        self.assertEqual(token.expires_at, expires_at)
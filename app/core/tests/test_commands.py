@@ -1,22 +1,170 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from core import maintenance
+from core.models import AuthToken, Ingredient, Recipe, Tag
+from core.search import search_vector
+
+
+PING = 'core.management.commands.wait_for_db.Command.ping'
 
 
 class CommandTests(TestCase):
 
     def test_waitForDbReady(self):
         """test waiting fir db when db is available"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+        with patch(PING) as ping:
+            ping.return_value = None
+            call_command('wait_for_db', database=['default'])
+            self.assertEqual(ping.call_count, 1)
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """test waiting for db"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        with patch(PING) as ping:
+            ping.side_effect = [OperationalError] * 5 + [None]
+            call_command('wait_for_db', database=['default'])
+            self.assertEqual(ping.call_count, 6)
+            self.assertEqual(ts.call_count, 5)
+
+    @patch('random.uniform', side_effect=lambda low, high: high)
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backoff(self, ts, uniform):
+        """test the wait doubles up to the maximum delay"""
+        with patch(PING) as ping:
+            ping.side_effect = [OperationalError] * 6 + [None]
+            call_command('wait_for_db', database=['default'], max_delay=1)
+
+        waits = [c.args[0] for c in ts.call_args_list]
+        self.assertEqual(waits, [0.1, 0.2, 0.4, 0.8, 1, 1])
+
+    def test_wait_for_db_timeout(self):
+        """test the command fails once the timeout passes"""
+        with patch(PING, side_effect=OperationalError('down')):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', database=['default'], timeout=0)
+
+    def test_wait_for_db_real_connection(self):
+        """test the probe and warmup run against the database"""
+        out = StringIO()
+        call_command('wait_for_db', warmup=True, stdout=out)
+
+        self.assertIn('Warmed up default', out.getvalue())
+
+    @patch('time.sleep', return_value=True)
+    def test_purge_tokens(self, ts):
+        """test expired tokens are purged in batches"""
+        user = get_user_model().obj.create_user('purge@fulltummy.com', 'pw')
+        past = timezone.now() - timedelta(seconds=1)
+        for _ in range(5):
+            AuthToken.objects.create(user=user, expires_at=past)
+        valid = AuthToken.objects.create(user=user)
+
+        call_command('purge_tokens', batch_size=2)
+
+        self.assertEqual(list(AuthToken.objects.all()), [valid])
+        self.assertEqual(ts.call_count, 2)
+
+    def test_maintenance(self):
+        """test switching maintenance mode on and off"""
+        self.addCleanup(maintenance.disable)
+        out = StringIO()
+
+        call_command('maintenance', 'on', retry_after=60, stdout=out)
+        self.assertEqual(maintenance.get_state(), {'retry_after': 60})
+        self.assertIn('Retry-After 60', out.getvalue())
+
+        call_command('maintenance', 'off', stdout=out)
+        self.assertIsNone(maintenance.get_state())
+
+    def test_bench(self):
+        """test the benchmark reports every endpoint and cleans up"""
+        out = StringIO()
+        call_command('bench', users=2, recipes=5, tags=3, ingredients=3,
+                     links=2, requests=4, warmup=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        recipes = report['endpoints']['recipe:recipe-list']
+        self.assertEqual(recipes['requests'], 4)
+        self.assertEqual(recipes['statuses'], {'200': 4})
+        self.assertGreater(recipes['queries_per_request'], 0)
+        self.assertLessEqual(recipes['p50_ms'], recipes['p99_ms'])
+        self.assertEqual(
+            report['endpoints']['recipe:tag-create']['statuses'],
+            {'201': 4})
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(get_user_model().obj.exists())
+
+    def test_bench_keep(self):
+        """test runs keeping their data seed users of their own"""
+        options = dict(users=1, recipes=1, tags=1, ingredients=1, links=1,
+                       requests=1, warmup=0, keep=True)
+
+        call_command('bench', stdout=StringIO(), **options)
+        call_command('bench', stdout=StringIO(), **options)
+
+        self.assertEqual(get_user_model().obj.count(), 2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_bench_baseline(self):
+        """test a run is compared with a baseline report"""
+        options = dict(users=1, recipes=2, tags=2, ingredients=2, links=1,
+                       requests=2, warmup=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, 'baseline.json')
+            call_command('bench', output=baseline, stdout=StringIO(),
+                         **options)
+            out = StringIO()
+            call_command('bench', baseline=baseline, stdout=out, **options)
+
+        diff = json.loads(out.getvalue())['diff']
+        self.assertIn('p95_ms', diff['user:me'])
+
+    def test_seed_data(self):
+        """test seeding users and linked recipes with COPY"""
+        def indexes():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT indexname FROM pg_indexes "
+                               "WHERE tablename LIKE 'core_%%'")
+                return {row[0] for row in cursor.fetchall()}
+        before = indexes()
+        options = dict(users=2, recipes=3, tags=4, ingredients=5, links=2,
+                       seed=7, password='seedpass', stdout=StringIO())
+
+        call_command('seed_data', **options)
+
+        self.assertEqual(indexes(), before)
+        self.assertEqual(Tag.objects.count(), 8)
+        self.assertEqual(Ingredient.objects.count(), 10)
+        recipes = list(Recipe.objects.order_by('id'))
+        self.assertEqual(len(recipes), 6)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(
+                set(recipe.ingredients.values_list('user', flat=True)),
+                {recipe.user_id})
+        self.assertFalse(Recipe.objects.filter(
+            search_vector__isnull=True).exists())
+        for seeded, computed in Recipe.objects.annotate(
+                computed=search_vector()).values_list('search_vector',
+                                                      'computed'):
+            self.assertEqual(seeded, computed)
+        user = get_user_model().obj.order_by('id').first()
+        self.assertTrue(user.check_password('seedpass'))
+
+        call_command('seed_data', **options)
+        titles = list(Recipe.objects.order_by('id')
+                      .values_list('title', flat=True))
+        self.assertEqual(titles[:6], titles[6:])
+        Tag.objects.create(user=user, name='after seeding')
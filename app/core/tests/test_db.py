@@ -0,0 +1,150 @@
+import time
+
+from django.db import connection
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase
+from psycopg2 import extensions
+
+from core.db.backends.postgresql.base import DatabaseWrapper
+from core.db.pool import ConnectionPool, close_pools
+
+
+class FakeConnection:
+    """Stand-in for a psycopg2 connection"""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.usable = True
+
+    def get_transaction_status(self):
+        return self.status
+
+    def cursor(self):
+        if not self.usable:
+            raise OperationalError('server closed the connection')
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the in-process connection pool"""
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, max_size=2, timeout=0)
+
+    def connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def test_reuses_released_connection(self):
+        """Test a released connection is handed out again"""
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+
+        self.assertIs(self.pool.acquire(), conn)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_exhausted(self):
+        """Test acquiring more than max size connections fails"""
+        self.pool.acquire()
+        self.pool.acquire()
+
+        with self.assertRaises(OperationalError):
+            self.pool.acquire()
+
+    def test_release_frees_slot(self):
+        """Test releasing a connection lets the next acquire proceed"""
+        conn = self.pool.acquire()
+        self.pool.acquire()
+        self.pool.release(conn)
+
+        self.assertIs(self.pool.acquire(), conn)
+
+    def test_idle_timeout(self):
+        """Test connections idle for too long are closed, not reused"""
+        self.pool.idle_timeout = 0
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+
+        self.assertIsNot(self.pool.acquire(), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.size, 1)
+
+    def test_release_in_transaction(self):
+        """Test a connection left inside a transaction is discarded"""
+        conn = self.pool.acquire()
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        self.pool.release(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.size, 0)
+
+    def test_check_replaces_dead_connection(self):
+        """Test a pooled connection failing the check is replaced"""
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        conn.usable = False
+
+        self.assertIsNot(self.pool.acquire(check=True), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.size, 1)
+
+
+class DatabaseWrapperTests(TestCase):
+    """Test persistent connections against the database"""
+
+    def make_wrapper(self, **settings):
+        wrapper = DatabaseWrapper({**connection.settings_dict, **settings},
+                                  'default')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+            for _ in range(50):
+                cursor.execute('SELECT 1 FROM pg_stat_activity '
+                               'WHERE pid = %s', [pid])
+                if cursor.fetchone() is None:
+                    return
+                time.sleep(0.02)
+
+    def test_health_check_replaces_dead_connection(self):
+        """Test a persistent connection killed between requests is
+        replaced before the next query"""
+        wrapper = self.make_wrapper(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        pid = self.backend_pid(wrapper)
+        self.terminate(pid)
+
+        wrapper.close_if_unusable_or_obsolete()
+
+        self.assertNotEqual(self.backend_pid(wrapper), pid)
+
+    def test_pool_reuses_connection(self):
+        """Test closing a pooled connection keeps it open for reuse"""
+        self.addCleanup(close_pools)
+        wrapper = self.make_wrapper(POOL={'ENABLED': True, 'MAX_SIZE': 2})
+        pid = self.backend_pid(wrapper)
+
+        wrapper.close()
+
+        self.assertEqual(self.backend_pid(wrapper), pid)
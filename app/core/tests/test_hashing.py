@@ -0,0 +1,76 @@
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.test import SimpleTestCase, TestCase
+
+from core import hashing
+from core.exceptions import ServiceBusy
+
+
+class HashingPoolTests(SimpleTestCase):
+    """Test the bounded password hashing pool"""
+
+    def setUp(self):
+        self.pool = hashing.HashingPool(workers=1, max_queue=1, timeout=5,
+                                        retry_after=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_run(self):
+        """Test the result of the function is returned"""
+        self.assertEqual(self.pool.run(sum, [1, 2]), 3)
+
+    def test_saturated(self):
+        """Test calls beyond workers plus queue are rejected at once"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        waiters = [threading.Thread(target=self.pool.run,
+                                    args=(release.wait,))
+                   for _ in range(2)]
+        for waiter in waiters:
+            waiter.start()
+        while self.pool.slots._value:
+            release.wait(0.01)
+
+        with self.assertRaises(ServiceBusy) as ctx:
+            self.pool.run(sum, [1])
+        self.assertEqual(ctx.exception.wait, 2)
+
+        release.set()
+        for waiter in waiters:
+            waiter.join()
+        self.assertEqual(self.pool.run(sum, [1]), 1)
+
+
+class PasswordTests(TestCase):
+    """Test users hash and verify passwords on the pool"""
+
+    def test_check_password(self):
+        """Test a password set through the pool verifies"""
+        user = get_user_model().obj.create_user('hash@fulltummy.com',
+                                                'secret123')
+
+        self.assertTrue(user.check_password('secret123'))
+        self.assertFalse(user.check_password('wrong'))
+
+    def test_outdated_hash_upgraded(self):
+        """Test a hash with fewer iterations is upgraded on login"""
+        user = get_user_model().obj.create_user('hash@fulltummy.com')
+        user.password = PBKDF2PasswordHasher().encode(
+            'secret123', 'salt', iterations=1000)
+        user.save()
+
+        self.assertTrue(user.check_password('secret123'))
+
+        user.refresh_from_db()
+        self.assertFalse(get_hasher('default').must_update(user.password))
+        self.assertTrue(user.check_password('secret123'))
+
+    def test_busy(self):
+        """Test a saturated pool surfaces as ServiceBusy"""
+        with patch.object(hashing.HashingPool, 'run',
+                          side_effect=ServiceBusy(wait=1)):
+            with self.assertRaises(ServiceBusy):
+                get_user_model().obj.create_user('hash@fulltummy.com',
+                                                 'secret123')
@@ -0,0 +1,291 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.task('test.add')
+def add(job):
+    calls.append(job.pk)
+    return {'sum': job.payload['a'] + job.payload['b']}
+
+
+@jobs.task('test.flaky', max_attempts=2)
+def flaky(job):
+    raise RuntimeError('try again')
+
+
+def job_url(pk):
+    return reverse('core:job', args=[pk])
+
+
+def jobs_conf(**kwargs):
+    conf = dict(settings.JOBS)
+    conf.update(kwargs)
+    return conf
+
+
+def run_due(worker='test'):
+    """Claim and run the due jobs in this thread"""
+    for pk in Job.objects.dequeue(worker, 100, 60):
+        jobs.run(Job.objects.get(pk=pk))
+
+
+class JobQueueTests(TestCase):
+    """Test queueing, claiming and running jobs"""
+
+    def setUp(self):
+        self.file_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.file_dir)
+        override = override_settings(JOBS=jobs_conf(FILE_DIR=self.file_dir))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.file_dir)
+                for name in names]
+
+    def test_enqueue(self):
+        """Test a job is queued with the task's attempt limit"""
+        job = jobs.enqueue('test.flaky', {'x': 1}, delay=60)
+
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.max_attempts, 2)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(jobs.enqueue('test.add').max_attempts,
+                         settings.JOBS['MAX_ATTEMPTS'])
+        with self.assertRaises(LookupError):
+            jobs.enqueue('test.missing')
+
+    def test_dequeue_claims_due_jobs(self):
+        """Test only due jobs are claimed, and only once per lease"""
+        due = jobs.enqueue('test.add')
+        jobs.enqueue('test.add', delay=60)
+
+        self.assertEqual(Job.objects.dequeue('a', 10, 60), [due.pk])
+        self.assertEqual(Job.objects.dequeue('b', 10, 60), [])
+        due.refresh_from_db()
+        self.assertEqual(due.status, Job.RUNNING)
+        self.assertEqual(due.worker, 'a')
+        self.assertEqual(due.attempts, 1)
+
+    def test_dequeue_expired_lease(self):
+        """Test a running job is claimed again once its lease ran out"""
+        job = jobs.enqueue('test.add')
+        Job.objects.dequeue('a', 10, 60)
+        Job.objects.filter(pk=job.pk).update(
+            run_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(Job.objects.dequeue('b', 10, 60), [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.worker, job.attempts), ('b', 2))
+
+    def test_dequeue_limit(self):
+        """Test no more jobs than the idle slots are claimed, oldest first"""
+        first = [jobs.enqueue('test.add').pk for _ in range(3)]
+
+        self.assertEqual(Job.objects.dequeue('a', 2, 60), first[:2])
+
+    def test_enqueue_file(self):
+        """Test a job's input file is stored for its task to read"""
+        job = jobs.enqueue('test.add', file=ContentFile(b'rows'))
+
+        self.assertTrue(job.file)
+        with jobs.open_file(job) as f:
+            self.assertEqual(f.read(), b'rows')
+
+    def test_run_done(self):
+        """Test a finished job records its result and drops its input"""
+        job = jobs.enqueue('test.add', {'a': 1, 'b': 2},
+                           file=ContentFile(b'x'))
+
+        run_due()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {'sum': 3})
+        self.assertEqual(job.file, '')
+        self.assertEqual(self.stored_files(), [])
+        self.assertIsNotNone(job.finished_at)
+
+    def test_run_retries_with_backoff(self):
+        """Test a failed attempt is retried later, the last one fails"""
+        job = jobs.enqueue('test.flaky', file=ContentFile(b'x'))
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            run_due()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(job.error, 'RuntimeError: try again')
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            run_due()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.stored_files(), [])
+
+    def test_purge_jobs(self):
+        """Test finished jobs past the retention are deleted"""
+        old = timezone.now() - timedelta(days=8)
+        expired = jobs.enqueue('test.add', file=ContentFile(b'x'))
+        Job.objects.filter(pk=expired.pk).update(status=Job.FAILED,
+                                                 finished_at=old)
+        recent = jobs.enqueue('test.add')
+        Job.objects.filter(pk=recent.pk).update(status=Job.DONE,
+                                                finished_at=timezone.now())
+        queued = jobs.enqueue('test.add')
+        out = StringIO()
+
+        call_command('purge_jobs', days=7, stdout=out)
+
+        self.assertIn('Purged 1 finished jobs', out.getvalue())
+        self.assertEqual(
+            sorted(Job.objects.values_list('pk', flat=True)),
+            [recent.pk, queued.pk])
+        self.assertEqual(self.stored_files(), [])
+
+    def test_purge_orphaned_files(self):
+        """Test old input files no job refers to are deleted"""
+        storage = jobs.get_storage()
+        orphan = storage.save('test.add/orphan', ContentFile(b'x'))
+        recent = storage.save('test.add/recent', ContentFile(b'x'))
+        queued = jobs.enqueue('test.add', file=ContentFile(b'x'))
+        old = (timezone.now() - timedelta(days=8)).timestamp()
+        for name in (orphan, queued.file):
+            os.utime(storage.path(name), (old, old))
+        out = StringIO()
+
+        call_command('purge_jobs', days=7, stdout=out)
+
+        self.assertIn('and 1 orphaned files', out.getvalue())
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(recent))
+        self.assertTrue(storage.exists(queued.file))
+
+    def test_enqueue_failed(self):
+        """Test the stored file is deleted when the job is not created"""
+        with patch.object(Job.objects, 'create',
+                          side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                jobs.enqueue('test.add', file=ContentFile(b'x'))
+
+        self.assertEqual(self.stored_files(), [])
+
+    def test_run_gives_up_after_lost_attempts(self):
+        """Test a job whose workers died on every attempt is not rerun"""
+        job = jobs.enqueue('test.add', {'a': 1, 'b': 1})
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts)
+        calls.clear()
+
+        run_due()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(calls, [])
+
+    def test_run_taken_over(self):
+        """Test a worker whose lease ran out does not overwrite the job"""
+        job = jobs.enqueue('test.add', {'a': 1, 'b': 1})
+        Job.objects.dequeue('a', 10, 60)
+        stale = Job.objects.get(pk=job.pk)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Job.objects.dequeue('b', 10, 60)
+
+        jobs.run(stale)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.RUNNING, 'b'))
+
+    @override_settings(JOBS=jobs_conf(BACKOFF_BASE=10, BACKOFF_MAX=60))
+    def test_backoff(self):
+        """Test the retry delay doubles with jitter up to the maximum"""
+        for attempts, delay in ((1, 10), (2, 20), (3, 40), (8, 60)):
+            self.assertGreaterEqual(jobs.backoff(attempts), delay / 2)
+            self.assertLessEqual(jobs.backoff(attempts), delay)
+
+
+class JobApiTests(TestCase):
+    """Test the job status endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='jobs@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        """Test that auth is required for the job status"""
+        job = jobs.enqueue('test.add', user=self.user)
+
+        res = APIClient().get(job_url(job.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_job_status(self):
+        """Test the owner sees the job's progress and result"""
+        job = jobs.enqueue('test.add', {'a': 2, 'b': 3}, user=self.user)
+        run_due()
+
+        res = self.client.get(job_url(job.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.DONE)
+        self.assertEqual(res.data['result'], {'sum': 5})
+        self.assertNotIn('payload', res.data)
+
+    def test_other_users_job(self):
+        """Test the jobs of other users are not found"""
+        other = get_user_model().obj.create_user(
+            email='jobs_other@fulltummy.com',
+            password='mypassword'
+        )
+        job = jobs.enqueue('test.add', user=other)
+
+        res = self.client.get(job_url(job.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WorkerTests(TransactionTestCase):
+    """Test running jobs on the worker's pool"""
+
+    def test_run_worker(self):
+        """Test the command runs the due jobs on threads and exits"""
+        queued = [jobs.enqueue('test.add', {'a': i, 'b': 1})
+                  for i in range(5)]
+        out = StringIO()
+
+        call_command('run_worker', burst=True, concurrency=2, pool='thread',
+                     stdout=out)
+
+        self.assertIn('Ran 5 jobs', out.getvalue())
+        self.assertEqual(
+            list(Job.objects.filter(pk__in=[job.pk for job in queued])
+                 .order_by('pk').values_list('result', flat=True)),
+            [{'sum': i + 1} for i in range(5)])
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+ROUTE = 'route="recipe:recipe-list",worker="%s"' % metrics.worker_name()
+
+
+def sample(text, line_start):
+    """Return the value of the first exported line with the prefix"""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class MetricsTests(TestCase):
+    """Test recording request metrics and exporting them"""
+
+    def setUp(self):
+        metrics.registry.reset()
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='metrics@fulltummy.com',
+            password='mypassword',
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(user=self.user, title='Soup',
+                              time_minutes=5, price=5)
+
+    def export(self):
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        return res.content.decode()
+
+    def test_records_route(self):
+        """Test a request is recorded under its route name"""
+        res = self.client.get(RECIPES_URL)
+
+        text = self.export()
+        self.assertEqual(sample(text, 'http_request_duration_seconds_count{%s}'
+                                % ROUTE), 1)
+        self.assertGreater(
+            sample(text, 'http_request_db_queries_sum{%s}' % ROUTE), 0)
+        self.assertGreater(sample(
+            text, 'http_request_serialize_duration_seconds_sum{%s}' % ROUTE),
+            0)
+        self.assertEqual(
+            sample(text, 'http_response_size_bytes_sum{%s}' % ROUTE),
+            len(res.content))
+
+    def test_buckets_cumulative(self):
+        """Test bucket counts include every smaller bucket"""
+        metrics.registry.observe('r', {'http_request_db_queries': 1})
+        metrics.registry.observe('r', {'http_request_db_queries': 7})
+
+        text = metrics.render_prometheus({'w': metrics.registry.snapshot()})
+
+        name = 'http_request_db_queries_bucket{route="r",worker="w",le="%s"}'
+        self.assertEqual(sample(text, name % 0), 0)
+        self.assertEqual(sample(text, name % 1), 1)
+        self.assertEqual(sample(text, name % 5), 1)
+        self.assertEqual(sample(text, name % 10), 2)
+        self.assertEqual(sample(text, name % '+Inf'), 2)
+
+    def test_exports_other_workers(self):
+        """Test histograms published by other workers are exported per
+        worker and expired workers are forgotten"""
+        metrics.registry.observe('r', {'http_request_db_queries': 1})
+        other = metrics.Registry()
+        other.observe('r', {'http_request_db_queries': 3})
+        shared = caches['shared']
+        shared.set('metrics:web2:1', other.snapshot())
+        worker = metrics.worker_name()
+        shared.set(metrics.WORKERS_KEY, {'web2:1', 'web2:2', worker})
+
+        collected = metrics.registry.collect()
+
+        self.assertEqual(set(collected), {'web2:1', worker})
+        self.assertEqual(
+            collected['web2:1'][('http_request_db_queries', 'r')][-1], 3)
+        self.assertEqual(shared.get(metrics.WORKERS_KEY), {'web2:1', worker})
+        text = metrics.render_prometheus(collected)
+        self.assertEqual(sample(text, 'http_request_db_queries_sum{route="r",'
+                                      'worker="web2:1"}'), 3)
+
+    def test_admin_only(self):
+        """Test the metrics are not exported to other users"""
+        self.user.is_staff = False
+        self.user.save()
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
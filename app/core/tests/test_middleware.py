@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe
+from core import maintenance
+from core.models import MaintenanceMode, Recipe
 
 ME_URL = reverse("user:me")
 RECIPE_URL = reverse("recipe:recipe-list")
@@ -103,3 +106,62 @@ class MiddlewareResposeTests(TestCase):
             recipe_detail_url(recipe.id), updated_payload)
         self.assertEqual(res_patch.status_code,
                          status.HTTP_200_OK)
+
+
+class RuntimeMaintenanceTests(TestCase):
+    """Test toggling maintenance mode through the flag row"""
+
+    def setUp(self):
+        maintenance.disable()
+        self.addCleanup(maintenance.disable)
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email="maintenance@fulltummy.com",
+            password="mypassword")
+        self.client.force_authenticate(self.user)
+
+    def test_toggle(self):
+        """Test enabling and disabling without a settings change"""
+        maintenance.enable(retry_after=30)
+
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '30')
+        self.assertEqual(res.json(), 'Service under maintenance')
+
+        maintenance.disable()
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_short_circuits_stack(self):
+        """Test the 503 skips the database and the other middleware"""
+        maintenance.enable()
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertNotIn('X-Frame-Options', res)
+
+    def test_allowed_paths(self):
+        """Test allowlisted paths are served during maintenance"""
+        maintenance.enable()
+
+        res = self.client.get('/admin/login/')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_flag_cached_locally(self):
+        """Test workers re-read the flag row only after the TTL"""
+        self.assertIsNone(maintenance.get_state())
+
+        # As toggled by another process
+        MaintenanceMode.objects.create(pk=maintenance.FLAG_ID,
+                                       retry_after=5)
+        self.assertIsNone(maintenance.get_state())
+
+        maintenance.reset()
+        self.assertEqual(maintenance.get_state(), {'retry_after': 5})
@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.exceptions import QueryBudgetExceeded
+from core.models import Recipe, Tag
+from core.query_budget import QueryBudget, fingerprint
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+TIGHT_BUDGETS = {'list': QueryBudget(queries=1)}
+
+
+def budget_conf(**kwargs):
+    conf = dict(settings.QUERY_BUDGET)
+    conf.update(kwargs)
+    return conf
+
+
+class FingerprintTests(TestCase):
+    """Test normalizing SQL into fingerprints"""
+
+    def test_values_collapsed(self):
+        """Test queries differing only in values share a fingerprint"""
+        first = fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s) '
+                            "AND  name = 'a' LIMIT 21")
+        second = fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) '
+                             "AND name = 'it''s' LIMIT 5")
+
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'SELECT * FROM "t" WHERE "id" IN (...) '
+                                   'AND name = ? LIMIT ?')
+
+
+class QueryBudgetTests(TestCase):
+    """Test enforcing the query budgets of views"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='budget@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+        recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                       time_minutes=5, price=5)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='veg'))
+
+    @patch.object(RecipeViewSet, 'query_budgets', TIGHT_BUDGETS)
+    def test_raise_over_budget(self):
+        """Test going over the budget fails the request in tests"""
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            self.client.get(RECIPES_URL)
+
+        report = ctx.exception.report
+        self.assertEqual(report['view'], 'recipe:recipe-list (list)')
+        self.assertGreater(report['queries'], 1)
+        sqls = [group['sql'] for group in report['fingerprints']]
+        self.assertTrue(any('"core_tag"' in sql for sql in sqls))
+
+    @override_settings(QUERY_BUDGET=budget_conf(MODE='log'))
+    @patch.object(RecipeViewSet, 'query_budgets', TIGHT_BUDGETS)
+    def test_log_over_budget(self):
+        """Test the log mode reports the SQL and its call sites"""
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('recipe:recipe-list (list)', logs.output[0])
+        self.assertIn('at recipe/', logs.output[0])
+
+    @override_settings(QUERY_BUDGET=budget_conf(MODE='sample',
+                                                SAMPLE_RATE=0))
+    @patch.object(RecipeViewSet, 'query_budgets', TIGHT_BUDGETS)
+    def test_sample_skips(self):
+        """Test requests left out of the sample are not checked"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_within_budget(self):
+        """Test the declared budgets hold for a list with relations"""
+        for i in range(5):
+            recipe = Recipe.objects.create(user=self.user, title='r%d' % i,
+                                           time_minutes=5, price=5)
+            recipe.tags.add(Tag.objects.create(user=self.user,
+                                               name='t%d' % i))
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,128 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe
+from core.response_cache import stats
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('core:cache-stats')
+
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'responses',
+    'TIMEOUT': 60,
+    'MAX_BYTES': 64 * 1024,
+}
+
+
+@override_settings(RESPONSE_CACHE=RESPONSE_CACHE)
+class ResponseCacheTests(TestCase):
+    """Test caching rendered list responses per user"""
+
+    def setUp(self):
+        caches['responses'].clear()
+        stats.reset()
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='response_cache@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                            time_minutes=5, price=5)
+
+    def test_repeated_list_served_from_cache(self):
+        """Test the second list is served from the cache"""
+        first = self.client.get(RECIPES_URL)
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(stats.snapshot()['hits'], 1)
+        self.assertEqual(stats.snapshot()['misses'], 1)
+
+    def test_write_invalidates(self):
+        """Test a write is visible on the next list"""
+        self.client.get(TAGS_URL)
+        Tag.objects.create(user=self.user, name='veg')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.json()['results'][0]['name'], 'veg')
+
+    def test_link_change_invalidates(self):
+        """Test changing the M2M links is visible on the next list"""
+        tag = Tag.objects.create(user=self.user, name='veg')
+        self.client.get(RECIPES_URL)
+        self.recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.json()['results'][0]['tags'], [tag.id])
+
+    def test_cache_per_user_and_query(self):
+        """Test entries are not shared across users or query strings"""
+        self.client.get(RECIPES_URL)
+        other = get_user_model().obj.create_user(
+            email='response_cache_other@fulltummy.com',
+            password='mypassword'
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        self.assertEqual(client.get(RECIPES_URL)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(RECIPES_URL, {'page_size': 1})
+                         ['X-Cache'], 'MISS')
+
+    @override_settings(RESPONSE_CACHE={**RESPONSE_CACHE, 'MAX_BYTES': 10})
+    def test_oversized_not_cached(self):
+        """Test responses over the size cap are not stored"""
+        self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(stats.snapshot()['oversized'], 2)
+
+    def test_stats_admin_only(self):
+        """Test the counters are only exposed to staff"""
+        self.client.get(RECIPES_URL)
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['misses'], 1)
+
+
+class ResponseCacheDisabledTests(TestCase):
+    """Test the response cache is opt in"""
+
+    def test_disabled_by_default(self):
+        """Test lists are not cached unless enabled"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().obj.create_user(
+            email='response_cache_off@fulltummy.com',
+            password='mypassword'
+        ))
+
+        res = client.get(TAGS_URL)
+
+        self.assertNotIn('X-Cache', res)
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.shedding import AdaptiveLimit, LoadShedder, get_load_shedder, \
+    reset_load_shedder
+
+RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('core:load-stats')
+
+
+def shedding_conf(**kwargs):
+    conf = dict(settings.LOAD_SHEDDING)
+    conf.update(kwargs)
+    return conf
+
+
+class AdaptiveLimitTests(TestCase):
+    """Test adapting a concurrency limit from observed latency"""
+
+    def busy_limit(self, conf):
+        limit = AdaptiveLimit(conf)
+        limit.in_flight = int(limit.limit)
+        return limit
+
+    def test_shrinks_when_latency_rises(self):
+        """Test the limit drops once requests get slower"""
+        limit = self.busy_limit(shedding_conf(INITIAL_LIMIT=50))
+        for _ in range(10):
+            limit.update(0.01)
+        before = limit.limit
+
+        for _ in range(20):
+            limit.update(0.2)
+
+        self.assertLess(limit.limit, before / 2)
+        self.assertGreaterEqual(limit.limit, limit.conf['MIN_LIMIT'])
+
+    def test_grows_when_busy_and_fast(self):
+        """Test the limit grows while saturated at baseline latency"""
+        limit = self.busy_limit(shedding_conf(INITIAL_LIMIT=10))
+
+        for _ in range(20):
+            limit.in_flight = int(limit.limit)
+            limit.update(0.01)
+
+        self.assertGreater(limit.limit, 10)
+
+    def test_idle_keeps_limit(self):
+        """Test fast responses with few requests in flight change nothing"""
+        limit = AdaptiveLimit(shedding_conf(INITIAL_LIMIT=10))
+
+        for _ in range(20):
+            limit.update(0.01)
+
+        self.assertEqual(limit.limit, 10)
+
+
+class LoadShedderTests(TestCase):
+    """Test admitting requests per route class"""
+
+    def setUp(self):
+        self.shedder = LoadShedder(shedding_conf(INITIAL_LIMIT=2))
+
+    def test_sheds_over_limit(self):
+        """Test a class at its limit sheds and recovers on release"""
+        self.assertTrue(self.shedder.acquire('read'))
+        self.assertTrue(self.shedder.acquire('read'))
+        self.assertFalse(self.shedder.acquire('read'))
+
+        self.shedder.release('read', 0.01)
+
+        self.assertTrue(self.shedder.acquire('read'))
+        self.assertEqual(self.shedder.snapshot()['read']['shed'], 1)
+
+    def test_classes_independent(self):
+        """Test a saturated class sheds no other class"""
+        self.shedder.acquire('auth')
+        self.shedder.acquire('auth')
+
+        self.assertFalse(self.shedder.acquire('auth'))
+        self.assertTrue(self.shedder.acquire('write'))
+        self.assertTrue(self.shedder.acquire('read'))
+        self.assertEqual(self.shedder.snapshot()['read']['shed'], 0)
+
+
+class LoadSheddingMiddlewareTests(TestCase):
+    """Test answering overloaded route classes with 503"""
+
+    def setUp(self):
+        reset_load_shedder()
+        self.addCleanup(reset_load_shedder)
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='shedding@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(LOAD_SHEDDING=shedding_conf(INITIAL_LIMIT=2))
+    def test_overloaded(self):
+        """Test requests over the limit get a 503 with Retry-After"""
+        shedder = get_load_shedder()
+        shedder.acquire('read')
+        shedder.acquire('read')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        res = self.client.post(RECIPES_URL, {'title': 'Soup',
+                                             'time_minutes': 5,
+                                             'price': 5})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_latency_recorded(self):
+        """Test admitted requests are counted and timed"""
+        self.client.get(RECIPES_URL)
+
+        read = get_load_shedder().snapshot()['read']
+        self.assertEqual(read['admitted'], 1)
+        self.assertEqual(read['in_flight'], 0)
+        self.assertIsNotNone(read['latency_ms'])
+
+    def test_stats_admin_only(self):
+        """Test the limits are reported to admins only"""
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data['classes']),
+                         ['auth', 'write', 'read'])
@@ -0,0 +1,21 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin:
+    """TestCase mixin for catching N+1 queries on list endpoints"""
+
+    def assertConstantQueries(self, fetch, grow, rounds=3):
+        """Assert `fetch` runs the same number of queries while `grow`
+        keeps adding rows before every round"""
+        counts = []
+        for _ in range(rounds):
+            grow()
+            with CaptureQueriesContext(connection) as ctx:
+                fetch()
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            'Query count grows with the number of rows: %s' % counts
+        )
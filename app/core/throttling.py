@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+class LoginGuard:
+    """Token buckets and progressive lockouts of login attempts
+
+    Every (scope, identity) pair has a local token bucket refilled at
+    RATE per second up to CAPACITY, so most rejections are decided in
+    process without any I/O. Attempts the local bucket lets through are
+    also counted in a fixed window of the shared cache, which keeps the
+    limit accurate across workers. After THRESHOLD failed logins the
+    identity is locked out for BASE seconds, doubling with every further
+    failure up to MAX.
+    """
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.shared = caches[conf['SHARED_CACHE']] \
+            if conf.get('SHARED_CACHE') else None
+        self._buckets = OrderedDict()
+        self._lockouts = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def check(self, scope, ident):
+        """Take one attempt, returning 0 or the seconds to wait"""
+        key = self.key(scope, ident)
+        now = time.time()
+        wait = self.local_wait(key, now) or self.take(scope, key, now)
+        if wait or self.shared is None:
+            return wait
+        return self.shared_wait(scope, key, now)
+
+    def local_wait(self, key, now):
+        until = self._lockouts.get(key)
+        return until - now if until and until > now else 0
+
+    def take(self, scope, key, now):
+        capacity, rate = self.limits(scope)
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            wait = 0
+            if tokens < 1:
+                wait = (1 - tokens) / rate
+            else:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.conf['MAX_ENTRIES']:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def shared_wait(self, scope, key, now):
+        until = self.shared.get('login-lock:%s' % key)
+        if until and until > now:
+            self._lockouts[key] = until
+            return until - now
+
+        capacity, rate = self.limits(scope)
+        window = int(capacity / rate)
+        window_key = 'login-window:%s:%d' % (key, now // window)
+        self.shared.add(window_key, 0, window)
+        try:
+            count = self.shared.incr(window_key)
+        except ValueError:
+            return 0
+        if count > capacity:
+            return window - now % window
+        return 0
+
+    def failed(self, scope, ident):
+        """Record a failed login, locking the identity out past the
+        threshold"""
+        key = self.key(scope, ident)
+        conf = self.conf['LOCKOUT']
+        failures_key = 'login-failures:%s' % key
+        with self._lock:
+            failures = self._failures.pop(key, 0) + 1
+            self._failures[key] = failures
+            if len(self._failures) > self.conf['MAX_ENTRIES']:
+                self._failures.pop(next(iter(self._failures)))
+        if self.shared is not None:
+            self.shared.add(failures_key, 0, conf['MAX'])
+            try:
+                failures = max(failures, self.shared.incr(failures_key))
+            except ValueError:
+                pass
+
+        if failures < conf['THRESHOLD']:
+            return
+        duration = min(conf['BASE'] * 2 ** (failures - conf['THRESHOLD']),
+                       conf['MAX'])
+        until = time.time() + duration
+        with self._lock:
+            if len(self._lockouts) >= self.conf['MAX_ENTRIES']:
+                now = time.time()
+                self._lockouts = {k: v for k, v in self._lockouts.items()
+                                  if v > now}
+            self._lockouts[key] = until
+        if self.shared is not None:
+            self.shared.set('login-lock:%s' % key, until, duration)
+
+    def succeeded(self, scope, ident):
+        key = self.key(scope, ident)
+        with self._lock:
+            self._failures.pop(key, None)
+            self._lockouts.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete_many(['login-failures:%s' % key,
+                                     'login-lock:%s' % key])
+
+    def limits(self, scope):
+        limit = self.conf[scope.upper()]
+        return limit['CAPACITY'], limit['RATE']
+
+    @staticmethod
+    def key(scope, ident):
+        return '%s:%s' % (scope, hashlib.md5(ident.encode()).hexdigest())
+
+
+_guard = None
+
+
+def get_login_guard():
+    """Return the process wide guard built from LOGIN_THROTTLE"""
+    global _guard
+    if _guard is None:
+        _guard = LoginGuard(settings.LOGIN_THROTTLE)
+    return _guard
+
+
+def reset_login_guard():
+    global _guard
+    _guard = None
+
+
+class LoginThrottle(BaseThrottle):
+    """Throttle of the token endpoint, checked before the credentials
+
+    Base of the login throttles, keyed on the client address unless a
+    subclass overrides `get_ident_value()`. `scope` names the
+    LOGIN_THROTTLE limits applied.
+    """
+    scope = None
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_value(request)
+        self.wait_seconds = 0
+        if ident:
+            self.wait_seconds = get_login_guard().check(self.scope, ident)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+    def failed(self, request):
+        ident = self.get_ident_value(request)
+        if ident:
+            get_login_guard().failed(self.scope, ident)
+
+    def succeeded(self, request):
+        ident = self.get_ident_value(request)
+        if ident:
+            get_login_guard().succeeded(self.scope, ident)
+
+
+class LoginIPThrottle(LoginThrottle):
+    scope = 'ip'
+
+    def succeeded(self, request):
+        # One good password from an address says nothing about the others
+        pass
+
+
+class LoginEmailThrottle(LoginThrottle):
+    scope = 'email'
+
+    def get_ident_value(self, request):
+        email = request.data.get('email') \
+            if hasattr(request.data, 'get') else None
+        return email.strip().lower() if isinstance(email, str) else None
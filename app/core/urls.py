@@ -0,0 +1,13 @@
+from django.urls import path
+from core import views
+
+
+app_name = 'core'
+
+urlpatterns = [
+    path('cache/stats/', views.ResponseCacheStatsView.as_view(),
+         name='cache-stats'),
+    path('load/stats/', views.LoadSheddingStatsView.as_view(),
+         name='load-stats'),
+    path('jobs/<int:pk>/', views.JobView.as_view(), name='job'),
+]
@@ -1,9 +1,61 @@
-from rest_framework import status
-from rest_framework.decorators import api_view
+import os
+
+from django.http import HttpResponse
+from rest_framework import generics, permissions
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import metrics, response_cache, shedding
+from core.authentication import CachedTokenAuthentication
+from core.models import Job
+from core.serializers import JobSerializer
+
+
+class ResponseCacheStatsView(APIView):
+    """Hit and miss counters of the response cache in this worker"""
+    authentication_classes = (CachedTokenAuthentication,
+                              SessionAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({'pid': os.getpid(),
+                         **response_cache.stats.snapshot()})
+
+
+class LoadSheddingStatsView(APIView):
+    """Adaptive limits, in-flight requests and latency of this worker"""
+    authentication_classes = (CachedTokenAuthentication,
+                              SessionAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({'pid': os.getpid(),
+                         'classes': shedding.get_load_shedder().snapshot()})
+
+
+class MetricsView(APIView):
+    """Request histograms of all workers in the Prometheus text format"""
+    authentication_classes = (CachedTokenAuthentication,
+                              SessionAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render_prometheus(metrics.registry.collect()),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
+class JobView(generics.RetrieveAPIView):
+    """Status of one of the user's background jobs"""
+    serializer_class = JobSerializer
+    authentication_classes = (CachedTokenAuthentication,
+                              SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated,)
 
-@api_view(['GET', 'POST', 'PUT', 'PATCH'])
-def MaintenanceModeView(request):
-    return Response(data="Service under maintenance",
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    def get_queryset(self):
+        jobs = Job.objects.defer('payload')
+        if self.request.user.is_staff:
+            return jobs
+        return jobs.filter(user=self.request.user)
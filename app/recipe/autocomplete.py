@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import caches
+from django.db import connections, router
+from django.db.models import BooleanField, Case, Func, IntegerField, Q, \
+    Value, When
+from django.db.models.functions import Length
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+_trigram_enabled = {}
+
+
+class ILikeContains(Func):
+    """Case insensitive substring match of `term` compiled to `ILIKE`
+
+    `icontains` compiles to `UPPER(name) LIKE UPPER(...)` on PostgreSQL,
+    an expression the trigram index on `name` cannot serve.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, expression, term):
+        super().__init__(expression)
+        self.term = term
+
+    def as_sql(self, compiler, connection):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        return '%s ILIKE %%s' % lhs, params + [
+            '%%%s%%' % connection.ops.prep_for_like_query(self.term)]
+
+
+def trigram_enabled(alias):
+    """Whether pg_trgm is installed, looked up once per process"""
+    if alias not in _trigram_enabled:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_enabled[alias] = cursor.fetchone() is not None
+    return _trigram_enabled[alias]
+
+
+def match_names(queryset, term, limit):
+    """Top `limit` rows whose name contains `term`, prefix matches and
+    shorter names first
+
+    Substring matches use the pg_trgm GIN index on `name` when the
+    extension is installed, which then also adds typo tolerant matches
+    for longer fragments ranked by trigram similarity.
+    """
+    condition = Q(ILikeContains('name', term))
+    ordering = ['prefix']
+    alias = router.db_for_read(queryset.model)
+    if len(term) >= 3 and trigram_enabled(alias):
+        condition |= Q(name__trigram_similar=term)
+        queryset = queryset.annotate(
+            similarity=TrigramSimilarity('name', term))
+        ordering.append('-similarity')
+
+    return queryset.filter(condition).annotate(prefix=Case(
+        When(name__istartswith=term, then=Value(0)),
+        default=Value(1), output_field=IntegerField()
+    )).order_by(*ordering, Length('name'), 'name', 'id')[:limit]
+
+
+class AutocompleteMixin:
+    """Viewset mixin suggesting the user's names matching `?q=`
+
+    Results are cached per user for AUTOCOMPLETE['TIMEOUT'] seconds keyed
+    by the collection ETag, so a write shows up in the next keystroke and
+    unchanged suggestions are answered with 304.
+    """
+    autocomplete_max_length = 100
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        return self.conditional(self.suggest, request)
+
+    def suggest(self, request):
+        conf = settings.AUTOCOMPLETE
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        term = term[:self.autocomplete_max_length]
+        try:
+            limit = int(request.query_params.get('limit', conf['LIMIT']))
+        except ValueError:
+            raise ValidationError({'limit': 'Expected a number'})
+        limit = min(max(limit, 1), conf['MAX_LIMIT'])
+
+        cache = caches[conf['CACHE']]
+        etag, _ = self.get_validators(request)
+        key = 'autocomplete:%s:%s:%s' % (self.basename, request.user.pk,
+                                         etag.strip('"'))
+        results = cache.get(key)
+        if results is None:
+            queryset = self.queryset.filter(user=request.user)
+            serializer = self.get_serializer(
+                match_names(queryset, term, limit), many=True)
+            results = serializer.data
+            cache.set(key, results, conf['TIMEOUT'])
+
+        return Response({'results': results})
@@ -0,0 +1,218 @@
+from contextlib import nullcontext
+
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from core import search, versioning
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(),
+                                allow_empty=False)
+
+
+class BulkModelMixin:
+    """Viewset mixin accepting lists of objects at `<prefix>/bulk/`
+
+    POST creates, PATCH updates (each item carries its `id`) and DELETE
+    removes `{"ids": [...]}`. All items are validated in one pass, the
+    related ids named in `bulk_relations` are ownership checked with one
+    IN query per relation and the rows and M2M through rows are written
+    with bulk statements in a single transaction. Nothing is written
+    unless every item is valid, the errors are then reported per item.
+    """
+    bulk_max_items = 1000
+    bulk_batch_size = 500
+    bulk_serializer_class = None
+    bulk_relations = ()
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        if request.method == 'POST':
+            return self.create_many(request)
+        if request.method == 'PATCH':
+            return self.update_many(request)
+        return self.destroy_many(request)
+
+    def create_many(self, request):
+        items = self.get_bulk_items(request.data)
+        validated, errors = self.validate_items(items)
+        if errors:
+            return self.get_error_response(errors)
+        model = self.queryset.model
+
+        with transaction.atomic():
+            instances = model.objects.bulk_create(
+                [model(user=request.user, **self.get_fields(data))
+                 for data in validated],
+                batch_size=self.bulk_batch_size
+            )
+            self.save_relations(instances, validated, created=True)
+            self.bulk_changed(request.user, instances, created=True)
+
+        return self.get_bulk_response(instances, status.HTTP_201_CREATED)
+
+    def update_many(self, request):
+        items = self.get_bulk_items(request.data)
+        model = self.queryset.model
+        ids = [item.get('id') if isinstance(item, dict) else None
+               for item in items]
+        found = model.objects.filter(user=request.user).in_bulk(
+            [pk for pk in ids
+             if isinstance(pk, int) and not isinstance(pk, bool)])
+        instances = [found.get(pk) for pk in ids]
+        validated, errors = self.validate_items(items, instances)
+        if errors:
+            return self.get_error_response(errors)
+
+        fields = set()
+        for instance, data in zip(instances, validated):
+            for attr, value in self.get_fields(data).items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+
+        with transaction.atomic():
+            if fields:
+                model.objects.bulk_update(found.values(), fields,
+                                          batch_size=self.bulk_batch_size)
+            self.save_relations(instances, validated)
+            self.bulk_changed(request.user, instances)
+
+        return self.get_bulk_response(instances, status.HTTP_200_OK)
+
+    def destroy_many(self, request):
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = self.get_bulk_items(serializer.validated_data['ids'])
+        model = self.queryset.model
+
+        queryset = model.objects.filter(user=request.user, pk__in=ids)
+        with versioning.deferred_bumps(), search.deferred_updates(), \
+                self.bulk_deleting(queryset):
+            _, deleted = queryset.delete()
+
+        return Response({'deleted': deleted.get(model._meta.label, 0)})
+
+    def bulk_deleting(self, queryset):
+        """Context the rows of `queryset` are deleted in"""
+        return nullcontext()
+
+    def bulk_changed(self, user, instances, created=False):
+        """Bump the collection versions bulk statements skip signals for"""
+        model = self.queryset.model
+        related = [model._meta.get_field(name).related_model
+                   for name in self.bulk_relations]
+        versioning.bump(user.pk, model, *related)
+
+    def get_bulk_items(self, data):
+        if not isinstance(data, list):
+            raise ValidationError({'errors': ['Expected a list of items.']})
+        if len(data) > self.bulk_max_items:
+            raise ValidationError({'errors': [
+                'At most %d items per request.' % self.bulk_max_items]})
+        return data
+
+    def get_bulk_serializer_class(self):
+        return self.bulk_serializer_class or self.get_serializer_class()
+
+    def validate_items(self, items, instances=None):
+        """Validate every item, returning their validated data and the
+        errors by item index"""
+        serializer_class = self.get_bulk_serializer_class()
+        context = {**self.get_serializer_context(), 'bulk': True}
+        validated, errors = [], {}
+        for index, item in enumerate(items):
+            instance = instances[index] if instances is not None else None
+            if instances is not None and instance is None:
+                validated.append(None)
+                errors[index] = {'id': ['Not found.']}
+                continue
+            serializer = serializer_class(instance, data=item, context=context,
+                                          partial=instance is not None)
+            if serializer.is_valid():
+                validated.append(serializer.validated_data)
+            else:
+                validated.append(None)
+                errors[index] = dict(serializer.errors)
+
+        self.check_relations(validated, errors)
+        return validated, errors
+
+    def check_relations(self, validated, errors):
+        """Reject related ids the user does not own, one query each"""
+        model = self.queryset.model
+        for name in self.bulk_relations:
+            related = model._meta.get_field(name).related_model
+            ids = {pk for data in validated if data
+                   for pk in data.get(name, ())}
+            owned = set(related.objects.filter(
+                user=self.request.user, pk__in=ids
+            ).values_list('pk', flat=True)) if ids else set()
+
+            for index, data in enumerate(validated):
+                missing = [pk for pk in (data or {}).get(name, ())
+                           if pk not in owned]
+                if missing:
+                    errors.setdefault(index, {})[name] = [
+                        'Invalid pk "%s" - object does not exist.' % pk
+                        for pk in missing
+                    ]
+
+    def get_fields(self, data):
+        return {attr: value for attr, value in data.items()
+                if attr not in self.bulk_relations}
+
+    def save_relations(self, instances, validated, created=False):
+        """Write the M2M links of the items that sent them, only adding
+        and removing the through rows that changed"""
+        model = self.queryset.model
+        for name in self.bulk_relations:
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = '%s_id' % field.m2m_field_name()
+            target = '%s_id' % field.m2m_reverse_field_name()
+
+            touched = {instance.pk for instance, data
+                       in zip(instances, validated) if name in data}
+            if not touched:
+                continue
+            wanted = {(instance.pk, pk) for instance, data
+                      in zip(instances, validated) if name in data
+                      for pk in data[name]}
+
+            existing = {}
+            if not created:
+                existing = {
+                    (link[1], link[2]): link[0] for link in
+                    through.objects.filter(**{'%s__in' % source: touched})
+                    .values_list('pk', source, target)
+                }
+                stale = [pk for link, pk in existing.items()
+                         if link not in wanted]
+                if stale:
+                    through.objects.filter(pk__in=stale).delete()
+
+            through.objects.bulk_create(
+                [through(**{source: a, target: b})
+                 for a, b in wanted if (a, b) not in existing],
+                batch_size=self.bulk_batch_size
+            )
+
+    def get_error_response(self, errors):
+        return Response({'errors': [
+            {'index': index, 'errors': errors[index]}
+            for index in sorted(errors)
+        ]}, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_bulk_response(self, instances, status_code):
+        unique = list({instance.pk: instance for instance in instances}
+                      .values())
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'load_related'):
+            serializer_class.load_related(unique)
+        serializer = self.get_serializer(instances, many=True)
+
+        return Response({'results': serializer.data}, status=status_code)
@@ -0,0 +1,116 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+
+from core.models import Recipe
+from recipe import filters
+
+FIELDS = ('id', 'title', 'time_minutes', 'price', 'link')
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'recipes.ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'recipes.csv'),
+}
+
+
+class OutputNegotiation(BaseContentNegotiation):
+    """The export picks its format from `?output=`, any Accept header is
+    fine"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def linked_ids(through, field, recipe_ids):
+    """Map each recipe id to the ids it links through `through`"""
+    links = defaultdict(list)
+    rows = through.objects.filter(recipe_id__in=recipe_ids) \
+        .order_by(field).values_list('recipe_id', field)
+    for recipe_id, pk in rows:
+        links[recipe_id].append(pk)
+    return links
+
+
+def export_rows(queryset, chunk_size):
+    """Yield the recipes as dicts with their tag and ingredient ids
+
+    The recipes are read from a server side cursor `chunk_size` rows at a
+    time, and the links of each chunk with one query per relation, so
+    memory use does not grow with the size of the library.
+    """
+    rows = queryset.values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        ids = [row[0] for row in chunk]
+        tags = linked_ids(Recipe.tags.through, 'tag_id', ids)
+        ingredients = linked_ids(Recipe.ingredients.through,
+                                 'ingredient_id', ids)
+        for row in chunk:
+            recipe = dict(zip(FIELDS, row))
+            recipe['price'] = str(recipe['price'])
+            recipe['tags'] = tags.get(row[0], [])
+            recipe['ingredients'] = ingredients.get(row[0], [])
+            yield recipe
+
+
+def ndjson_lines(recipes):
+    for recipe in recipes:
+        yield json.dumps(recipe) + '\n'
+
+
+class Echo:
+    """Pseudo buffer handing back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(recipes):
+    """CSV with the linked ids space separated in one column"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS + ('tags', 'ingredients'))
+    for recipe in recipes:
+        yield writer.writerow(
+            [recipe[field] for field in FIELDS] +
+            [' '.join(map(str, recipe['tags'])),
+             ' '.join(map(str, recipe['ingredients']))])
+
+
+class ExportMixin:
+    """Viewset mixin streaming all of the user's recipes
+
+    `?output=ndjson` (default) or `?output=csv`, the list filters apply.
+    """
+
+    @action(detail=False, content_negotiation_class=OutputNegotiation)
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in FORMATS:
+            raise ValidationError(
+                {'output': 'Expected one of %s' % ', '.join(FORMATS)})
+
+        queryset = filters.filter_recipes(
+            Recipe.objects.filter(user=request.user), request.query_params
+        ).order_by('id')
+        recipes = export_rows(queryset,
+                              settings.RECIPE_EXPORT['CHUNK_SIZE'])
+        lines = ndjson_lines(recipes) if output == 'ndjson' \
+            else csv_lines(recipes)
+
+        content_type, filename = FORMATS[output]
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = \
+            'attachment; filename="%s"' % filename
+        return response
@@ -0,0 +1,84 @@
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import DecimalField, Exists, F, OuterRef
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+from core.search import SEARCH_CONFIG
+
+
+def int_list(params, name):
+    """Parse a comma separated list of ids, e.g. `tags=1,2`"""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return [int(str_id) for str_id in value.split(',')]
+    except ValueError:
+        raise ValidationError({name: 'Expected a comma separated id list'})
+
+
+def number(params, name, cast):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except (ValueError, InvalidOperation):
+        raise ValidationError({name: 'Expected a number'})
+
+
+def search_terms(params):
+    return params.get('search', '').strip() or None
+
+
+def filter_recipes(queryset, params):
+    """Apply the recipe list query parameters
+
+    Tag and ingredient filters are EXISTS subqueries on the through tables
+    so matching several ids never duplicates a recipe and needs no
+    DISTINCT over the joined rows. `search` matches the stored search
+    vector through its GIN index and annotates the `rank`, cast to a
+    numeric so keyset cursors compare it exactly.
+    """
+    terms = search_terms(params)
+    if terms:
+        # plainto_tsquery, websearch_to_tsquery needs PostgreSQL 11
+        query = SearchQuery(terms, config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query),
+                      DecimalField(max_digits=12, decimal_places=8)))
+
+    tag_ids = int_list(params, 'tags')
+    if tag_ids:
+        queryset = queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tag_ids)))
+
+    ingredient_ids = int_list(params, 'ingredients')
+    if ingredient_ids:
+        queryset = queryset.filter(Exists(
+            Recipe.ingredients.through.objects.filter(
+                recipe=OuterRef('pk'), ingredient__in=ingredient_ids)))
+
+    max_price = number(params, 'max_price', Decimal)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    max_time = number(params, 'max_time_minutes', int)
+    if max_time is not None:
+        queryset = queryset.filter(time_minutes__lte=max_time)
+
+    return queryset
+
+
+def filter_assigned(queryset, params, through):
+    """Keep only tags or ingredients linked to a recipe with
+    `assigned_only=1`"""
+    if not number(params, 'assigned_only', int):
+        return queryset
+
+    field = queryset.model._meta.model_name
+    return queryset.filter(Exists(through.objects.filter(
+        **{field: OuterRef('pk')})))
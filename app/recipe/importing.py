@@ -0,0 +1,246 @@
+import csv
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+
+from core import jobs, search, versioning
+from core.exceptions import ImportConflict
+from core.models import Tag, Ingredient, Recipe, RecipeImport
+from recipe.serializers import RecipeImportSerializer
+
+FORMATS = ('ndjson', 'csv')
+
+# Separates the tag and ingredient names of a CSV cell
+CSV_LIST_SEPARATOR = ';'
+
+
+def read_ndjson(binary):
+    """Yield `(item, error)` per non blank line of a binary file"""
+    for line in binary:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None, {'non_field_errors': ['Invalid JSON.']}
+            continue
+        if not isinstance(item, dict):
+            yield None, {'non_field_errors': ['Expected an object.']}
+        else:
+            yield item, None
+
+
+def read_csv(binary):
+    """Yield `(item, error)` per data row of a binary CSV file with a
+    header, tags and ingredients are `;` separated names
+
+    Lines are decoded one at a time, a record with invalid UTF-8 or one
+    the CSV parser rejects is reported as an error and the next one read.
+    """
+    undecodable = []
+
+    def lines():
+        for line in binary:
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError:
+                undecodable.append(line)
+                yield line.decode('utf-8', 'replace')
+
+    reader = csv.reader(lines())
+    header = None
+    while True:
+        try:
+            row = next(reader)
+            error = 'Invalid UTF-8.' if undecodable else None
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            error = 'Invalid CSV: %s.' % exc
+        del undecodable[:]
+        if header is None:
+            if error is not None:
+                yield None, {'non_field_errors': ['Header: ' + error]}
+                return
+            header = row
+        elif error is not None:
+            yield None, {'non_field_errors': [error]}
+        elif row:
+            item = dict(zip(header, row))
+            for field in ('tags', 'ingredients'):
+                item[field] = [name.strip() for name in
+                               (item.get(field) or '').split(
+                                   CSV_LIST_SEPARATOR)
+                               if name.strip()]
+            yield item, None
+
+
+def content_key(name, binary):
+    """Default import key, the name and a digest of the content so an
+    edited file does not resume the rows of its earlier version"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: binary.read(65536), b''):
+        digest.update(chunk)
+    binary.seek(0)
+    return '%s:%s' % (name[-190:], digest.hexdigest())
+
+
+def read_rows(binary, input_format):
+    if input_format == 'csv':
+        return read_csv(binary)
+    return read_ndjson(binary)
+
+
+class RecipeImporter:
+    """Import recipes naming their tags and ingredients, batch by batch
+
+    Rows are validated one at a time, the valid ones are written every
+    RECIPE_IMPORT['BATCH_SIZE'] rows in one transaction: the missing
+    names are upserted with one statement per model and remembered for
+    the rest of the import, then the recipes and their links go in with
+    bulk inserts. The transaction also records how many rows are done
+    under the import `key`, running the same key again skips them.
+    """
+
+    def __init__(self, user, key, batch_size=None, progress=None):
+        conf = settings.RECIPE_IMPORT
+        self.user = user
+        self.key = key
+        self.batch_size = batch_size or conf['BATCH_SIZE']
+        self.max_errors = conf['MAX_ERRORS']
+        self.progress = progress
+        self.names = {Tag: {}, Ingredient: {}}
+
+    def run(self, rows):
+        state, _ = RecipeImport.objects.get_or_create(user=self.user,
+                                                      key=self.key)
+        self.state = state
+        self.result = {'key': self.key, 'skipped': state.rows_done,
+                       'rows': state.rows_done, 'imported': 0, 'failed': 0,
+                       'errors': []}
+        batch = []
+        number = 0
+        for number, (item, error) in enumerate(rows, 1):
+            if number <= state.rows_done:
+                continue
+            if error is None:
+                serializer = RecipeImportSerializer(data=item)
+                if serializer.is_valid():
+                    batch.append(serializer.validated_data)
+                else:
+                    error = serializer.errors
+            if error is not None:
+                self.failed(number, error)
+            if number - state.rows_done >= self.batch_size:
+                self.write(batch, number)
+                batch = []
+        if number > state.rows_done:
+            self.write(batch, number)
+        return self.result
+
+    def failed(self, number, errors):
+        self.result['failed'] += 1
+        if len(self.result['errors']) < self.max_errors:
+            self.result['errors'].append({'row': number, 'errors': errors})
+
+    def write(self, batch, rows_done):
+        try:
+            recipes = self.write_batch(batch, rows_done)
+        except IntegrityError:
+            # A tag or ingredient remembered from an earlier batch was
+            # deleted since, upsert the batch's names again
+            self.names = {Tag: {}, Ingredient: {}}
+            recipes = self.write_batch(batch, rows_done)
+
+        self.state.rows_done = rows_done
+        self.result['rows'] = rows_done
+        self.result['imported'] += len(recipes)
+        if self.progress is not None:
+            self.progress(self.result)
+
+    def write_batch(self, batch, rows_done):
+        with transaction.atomic():
+            locked = RecipeImport.objects.select_for_update().only(
+                'rows_done').get(pk=self.state.pk)
+            if locked.rows_done != self.state.rows_done:
+                raise ImportConflict()
+            tags = self.resolve(Tag, batch, 'tags')
+            ingredients = self.resolve(Ingredient, batch, 'ingredients')
+            recipes = Recipe.objects.bulk_create([
+                Recipe(user=self.user, title=data['title'],
+                       time_minutes=data['time_minutes'],
+                       price=data['price'], link=data.get('link', ''))
+                for data in batch])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe=recipe, tag_id=pk)
+                for recipe, pks in zip(recipes, tags) for pk in pks])
+            Recipe.ingredients.through.objects.bulk_create([
+                Recipe.ingredients.through(recipe=recipe, ingredient_id=pk)
+                for recipe, pks in zip(recipes, ingredients) for pk in pks])
+            if recipes:
+                search.update_search_vectors(r.pk for r in recipes)
+                versioning.bump(self.user.pk, Recipe, Tag, Ingredient)
+            RecipeImport.objects.filter(pk=self.state.pk).update(
+                rows_done=rows_done, modified_at=timezone.now())
+            # Check the deferred foreign keys of the links here, where
+            # the batch can still be retried
+            connection.check_constraints()
+        return recipes
+
+    def resolve(self, model, batch, field):
+        """Return the ids of each item's names, upserting the names not
+        seen earlier in the import"""
+        known = self.names[model]
+        missing = {}
+        for data in batch:
+            for name in data.get(field, ()):
+                if name.lower() not in known:
+                    missing.setdefault(name.lower(), name)
+        if missing:
+            rows = model.objects.upsert(self.user, list(missing.values()))
+            for key, (pk, _, _) in zip(missing, rows):
+                known[key] = pk
+        return [list(dict.fromkeys(known[name.lower()]
+                                   for name in data.get(field, ())))
+                for data in batch]
+
+
+class ImportMixin:
+    """Viewset mixin importing recipes from an uploaded NDJSON or CSV
+    `file`
+
+    The format follows `input` or the file extension. Posting the same
+    `key` again (by default the file name and a digest of its content)
+    resumes an import that was cut off after its last written batch.
+    With `background=1` the file is imported by a job instead, the 202
+    response links to its status.
+    """
+
+    @action(detail=False, methods=['post'], url_path='import',
+            url_name='import', parser_classes=(MultiPartParser,))
+    def import_recipes(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'No file was submitted.'})
+        input_format = request.data.get('input') or (
+            'csv' if upload.name.lower().endswith('.csv') else 'ndjson')
+        if input_format not in FORMATS:
+            raise ValidationError(
+                {'input': 'Expected one of %s' % ', '.join(FORMATS)})
+        key = request.data.get('key') or content_key(upload.name,
+                                                     upload.file)
+
+        if request.data.get('background') == '1':
+            return jobs.accepted(jobs.enqueue(
+                'recipe.import', {'key': key[:255], 'input': input_format},
+                user=request.user, file=upload))
+        importer = RecipeImporter(request.user, key[:255])
+        return Response(importer.run(read_rows(upload.file, input_format)))
@@ -0,0 +1,52 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exceptions import ImportConflict
+from recipe.importing import FORMATS, RecipeImporter, content_key, \
+    read_rows
+
+
+class Command(BaseCommand):
+    """Django command to import a user's recipes from an NDJSON or CSV
+    file, resuming after the rows a previous run with the same key wrote"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Owner of the imported recipes')
+        parser.add_argument('path')
+        parser.add_argument('--input', choices=FORMATS,
+                            help='File format (default: from the extension)')
+        parser.add_argument('--key',
+                            help='Import key (default: the absolute path and '
+                                 'a digest of the content)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().obj.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('No user %s' % options['email'])
+        path = os.path.abspath(options['path'])
+        input_format = options['input'] or (
+            'csv' if path.lower().endswith('.csv') else 'ndjson')
+
+        try:
+            with open(path, 'rb') as f:
+                importer = RecipeImporter(
+                    user, options['key'] or content_key(path, f),
+                    batch_size=options['batch_size'], progress=self.progress)
+                result = importer.run(read_rows(f, input_format))
+        except (OSError, ImportConflict) as exc:
+            raise CommandError(exc)
+
+        for error in result['errors']:
+            self.stderr.write('Row %(row)d: %(errors)s' % error)
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %(imported)d recipes, %(failed)d rows failed, '
+            '%(skipped)d skipped as already imported' % result))
+
+    def progress(self, result):
+        self.stdout.write('%(rows)d rows done, %(imported)d imported' %
+                          result)
@@ -1,9 +1,45 @@
+from django.db.models import Prefetch, Value
+from django.db.models.functions import Lower
 from rest_framework import serializers
 
 from core.models import Tag, Ingredient, Recipe
+from core.serializers import EagerLoadingMixin, MeasuredSerializerMixin, \
+    UserOwnedRelatedField
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """Reject a name the user already has, ignoring case
+
+    The bulk endpoints check all names of a request at once instead and
+    mark their serializers with `bulk` in the context.
+    """
+    duplicate_name_message = 'You already have one named "%s".'
+
+    def validate_name(self, value):
+        if self.context.get('bulk'):
+            return value
+        request = self.context['request']
+        existing = self.Meta.model.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(user=request.user, lower_name=Lower(Value(value)))
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError(
+                self.duplicate_name_message % value)
+        return value
+
+
+class NameListSerializer(serializers.Serializer):
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
+class TagSerializer(MeasuredSerializerMixin, UniqueNameMixin,
+                    serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -12,7 +48,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(MeasuredSerializerMixin, UniqueNameMixin,
+                           serializers.ModelSerializer):
     """Serializer for Ingredient objects"""
 
     class Meta:
@@ -21,13 +58,19 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(MeasuredSerializerMixin, EagerLoadingMixin,
+                       serializers.ModelSerializer):
     """Serializer for Recipe objects"""
-    ingredients = serializers.PrimaryKeyRelatedField(
+    prefetch_related_fields = (
+        Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+        Prefetch('tags', queryset=Tag.objects.only('id')),
+    )
+    relation_fields = ('ingredients', 'tags')
+    ingredients = UserOwnedRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserOwnedRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -37,3 +80,69 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "title", "time_minutes", "price", "link",
                   "ingredients", "tags")
         read_only_fields = ("id",)
+
+    def create(self, validated_data):
+        relations = self.pop_relations(validated_data)
+        recipe = super().create(validated_data)
+        self.save_relations(recipe, relations, created=True)
+        return recipe
+
+    def update(self, instance, validated_data):
+        relations = self.pop_relations(validated_data)
+        recipe = super().update(instance, validated_data)
+        self.save_relations(recipe, relations)
+        return recipe
+
+    def pop_relations(self, validated_data):
+        return {name: validated_data.pop(name)
+                for name in self.relation_fields if name in validated_data}
+
+    def save_relations(self, recipe, relations, created=False):
+        """Only add and remove the links that changed, the current links
+        come from the prefetched relation when the view loaded it"""
+        for name, objs in relations.items():
+            manager = getattr(recipe, name)
+            current = set() if created else \
+                {obj.pk for obj in manager.all()}
+            wanted = {obj.pk for obj in objs}
+            if current - wanted:
+                manager.remove(*(current - wanted))
+            if wanted - current:
+                manager.add(*(wanted - current))
+
+
+class RecipeBulkSerializer(MeasuredSerializerMixin,
+                           serializers.ModelSerializer):
+    """Validates recipe items sent to the bulk endpoint, the related ids
+    are checked for the whole request at once by the view"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ("title", "time_minutes", "price", "link",
+                  "ingredients", "tags")
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """Validates one imported recipe, tags and ingredients are given by
+    name and resolved per batch by the importer"""
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ("title", "time_minutes", "price", "link",
+                  "ingredients", "tags")
@@ -0,0 +1,15 @@
+from core import jobs
+from recipe.importing import RecipeImporter, read_rows
+
+
+@jobs.task('recipe.import')
+def import_recipes(job):
+    """Import the job's file, a retry resumes after the batches the
+    failed attempt wrote"""
+    if job.user is None:
+        # The account was deleted meanwhile
+        return None
+    importer = RecipeImporter(job.user, job.payload['key'],
+                              progress=lambda result: jobs.heartbeat(job))
+    with jobs.open_file(job) as f:
+        return importer.run(read_rows(f, job.payload['input']))
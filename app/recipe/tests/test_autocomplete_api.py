@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import CharField
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+from recipe.autocomplete import trigram_enabled
+
+
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+
+
+class AutocompleteApiTests(TestCase):
+    """Test suggesting tag and ingredient names"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='autocomplete@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def suggest(self, url, term, **params):
+        res = self.client.get(url, {'q': term, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data['results']]
+
+    def test_prefix_matches_first(self):
+        """Test prefix matches come before other substring matches"""
+        for name in ['sea salt', 'salted butter', 'salt', 'pepper']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        self.assertEqual(self.suggest(INGREDIENTS_AUTOCOMPLETE_URL, 'SAL'),
+                         ['salt', 'salted butter', 'sea salt'])
+
+    def test_substring_ilike(self):
+        """Test substrings match with ILIKE, wildcards taken literally"""
+        for name in ['100% rye', '100 rye', 'Rye_flour', 'ryeflour']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(
+                self.suggest(INGREDIENTS_AUTOCOMPLETE_URL, '0%'),
+                ['100% rye'])
+        self.assertTrue(any('ILIKE' in q['sql']
+                            for q in ctx.captured_queries))
+        self.assertEqual(self.suggest(INGREDIENTS_AUTOCOMPLETE_URL, 'E_F'),
+                         ['Rye_flour'])
+        self.assertNotIn('ilike_contains', CharField.get_lookups())
+
+    def test_limited_to_user(self):
+        """Test only the user's own names are suggested"""
+        other = get_user_model().obj.create_user(
+            email='autocomplete_other@fulltummy.com',
+            password='mypassword'
+        )
+        Tag.objects.create(user=other, name='vegan')
+        Tag.objects.create(user=self.user, name='vegetarian')
+
+        self.assertEqual(self.suggest(TAGS_AUTOCOMPLETE_URL, 'veg'),
+                         ['vegetarian'])
+
+    def test_limit(self):
+        """Test the number of suggestions is capped"""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name='tag %d' % i)
+
+        self.assertEqual(len(self.suggest(TAGS_AUTOCOMPLETE_URL, 'tag',
+                                          limit=2)), 2)
+
+    def test_query_required(self):
+        """Test a missing fragment is rejected"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_repeated_prefix_cached(self):
+        """Test a repeated fragment does not query the names again"""
+        Tag.objects.create(user=self.user, name='vegan')
+        self.suggest(TAGS_AUTOCOMPLETE_URL, 've')
+
+        with CaptureQueriesContext(connection) as ctx:
+            names = self.suggest(TAGS_AUTOCOMPLETE_URL, 've')
+
+        self.assertEqual(names, ['vegan'])
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'FROM "core_tag"' in q['sql']])
+
+    def test_write_refreshes_cache(self):
+        """Test a created name is suggested on the next request"""
+        Tag.objects.create(user=self.user, name='vegan')
+        self.suggest(TAGS_AUTOCOMPLETE_URL, 've')
+
+        Tag.objects.create(user=self.user, name='veggie')
+
+        self.assertEqual(self.suggest(TAGS_AUTOCOMPLETE_URL, 've'),
+                         ['vegan', 'veggie'])
+
+    def test_fuzzy_match(self):
+        """Test typos still match when pg_trgm is installed"""
+        if not trigram_enabled('default'):
+            self.skipTest('pg_trgm is not installed')
+        Ingredient.objects.create(user=self.user, name='cinnamon')
+
+        self.assertEqual(
+            self.suggest(INGREDIENTS_AUTOCOMPLETE_URL, 'cinamon'),
+            ['cinnamon'])
@@ -0,0 +1,282 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+TAGS_UPSERT_URL = reverse('recipe:tag-upsert')
+INGREDIENTS_UPSERT_URL = reverse('recipe:ingredient-upsert')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(**kwargs):
+    payload = {'title': 'Bulk recipe', 'time_minutes': 10, 'price': '5.00'}
+    payload.update(kwargs)
+    return payload
+
+
+class PublicBulkApiTests(TestCase):
+    """Test unauthenticated bulk API access"""
+
+    def test_auth_required(self):
+        """Test that auth is required for the bulk endpoints"""
+        res = APIClient().post(TAGS_BULK_URL, [], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBulkApiTests(TestCase):
+    """Test the bulk create, update and delete endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='bulk@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.other_user = get_user_model().obj.create_user(
+            email='bulk_other@fulltummy.com',
+            password='mypassword'
+        )
+
+    def test_bulk_create_tags(self):
+        """Test creating several tags in one request"""
+        payload = [{'name': 'veg'}, {'name': 'vegan'}, {'name': 'keto'}]
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([tag['name'] for tag in res.data['results']],
+                         ['veg', 'vegan', 'keto'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        inserts = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('INSERT INTO "core_tag"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_bulk_create_tags_duplicates(self):
+        """Test names repeated in the request or taken are rejected"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        payload = [{'name': 'keto'}, {'name': 'vegan'}, {'name': 'KETO'}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in res.data['errors']],
+                         [1, 2])
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_bulk_rename_tags(self):
+        """Test renaming a tag to another case of its name is allowed"""
+        tag = Tag.objects.create(user=self.user, name='vegan')
+
+        res = self.client.patch(TAGS_BULK_URL,
+                                [{'id': tag.id, 'name': 'Vegan'}],
+                                format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Vegan')
+
+    def test_bulk_create_ingredients_invalid(self):
+        """Test invalid items are reported by index and nothing saved"""
+        payload = [{'name': 'salt'}, {'name': ''}]
+
+        res = self.client.post(INGREDIENTS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['errors'][0]['index'], 1)
+        self.assertIn('name', res.data['errors'][0]['errors'])
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_bulk_create_recipes_with_relations(self):
+        """Test creating recipes and their links in bulk"""
+        tags = [Tag.objects.create(user=self.user, name='t%d' % i)
+                for i in range(2)]
+        ingredient = Ingredient.objects.create(user=self.user, name='salt')
+        payload = [
+            recipe_payload(title='first', tags=[tags[0].id, tags[1].id],
+                           ingredients=[ingredient.id]),
+            recipe_payload(title='second', tags=[tags[1].id]),
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        first, second = res.data['results']
+        self.assertEqual(sorted(first['tags']), [tags[0].id, tags[1].id])
+        self.assertEqual(first['ingredients'], [ingredient.id])
+        self.assertEqual(second['tags'], [tags[1].id])
+        recipe = Recipe.objects.get(id=second['id'])
+        self.assertEqual(list(recipe.tags.all()), [tags[1]])
+
+    def test_bulk_create_recipes_constant_queries(self):
+        """Test ownership checks do not query per referenced id"""
+        def post(count):
+            start = Tag.objects.count()
+            tags = [Tag.objects.create(user=self.user, name='t%d' % i)
+                    for i in range(start, start + count)]
+            payload = [recipe_payload(tags=[tag.id for tag in tags])
+                       for _ in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPES_BULK_URL, payload,
+                                       format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(ctx.captured_queries)
+
+        post(1)
+        self.assertEqual(post(2), post(20))
+
+    def test_bulk_create_rejects_foreign_ids(self):
+        """Test items linking another user's tags are rejected"""
+        own = Tag.objects.create(user=self.user, name='mine')
+        other = Tag.objects.create(user=self.other_user, name='theirs')
+        payload = [recipe_payload(tags=[own.id]),
+                   recipe_payload(tags=[own.id, other.id])]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['errors']), 1)
+        self.assertEqual(res.data['errors'][0]['index'], 1)
+        self.assertIn('tags', res.data['errors'][0]['errors'])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """Test updating fields and links of several recipes"""
+        keep = Tag.objects.create(user=self.user, name='keep')
+        drop = Tag.objects.create(user=self.user, name='drop')
+        add = Tag.objects.create(user=self.user, name='add')
+        recipe1 = Recipe.objects.create(user=self.user, title='one',
+                                        time_minutes=5, price=5)
+        recipe2 = Recipe.objects.create(user=self.user, title='two',
+                                        time_minutes=5, price=5)
+        recipe1.tags.add(keep, drop)
+        recipe2.tags.add(keep)
+        payload = [
+            {'id': recipe1.id, 'tags': [keep.id, add.id]},
+            {'id': recipe2.id, 'title': 'renamed'},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(recipe1.tags.all()), {keep, add})
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe2.title, 'renamed')
+        self.assertEqual(list(recipe2.tags.all()), [keep])
+
+    def test_bulk_update_other_users_recipe(self):
+        """Test updating recipes of another user is reported as not found"""
+        recipe = Recipe.objects.create(user=self.other_user, title='theirs',
+                                       time_minutes=5, price=5)
+
+        res = self.client.patch(RECIPES_BULK_URL,
+                                [{'id': recipe.id, 'title': 'mine'}],
+                                format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data['errors'][0]['errors'])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'theirs')
+
+    def test_bulk_update_bool_id(self):
+        """Test a boolean id is reported as not found, not read as 1"""
+        recipe = Recipe.objects.create(pk=1, user=self.user, title='one',
+                                       time_minutes=5, price=5)
+
+        res = self.client.patch(RECIPES_BULK_URL,
+                                [{'id': True, 'title': 'renamed'}],
+                                format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data['errors'][0]['errors'])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'one')
+
+    def test_bulk_delete_tags(self):
+        """Test deleting only the user's own tags"""
+        own = Tag.objects.create(user=self.user, name='mine')
+        other = Tag.objects.create(user=self.other_user, name='theirs')
+
+        res = self.client.delete(TAGS_BULK_URL, {'ids': [own.id, other.id]},
+                                 format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 1)
+        self.assertEqual(list(Tag.objects.all()), [other])
+
+    def test_bulk_limit(self):
+        """Test requests over the item limit are rejected"""
+        payload = [{'name': 'tag'}] * 1001
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_bulk_delete_limit(self):
+        """Test deletes over the item limit are rejected, not truncated"""
+        tag = Tag.objects.create(user=self.user, name='kept')
+
+        res = self.client.delete(TAGS_BULK_URL, {'ids': [tag.id] * 1001},
+                                 format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['errors'],
+                         ['At most 1000 items per request.'])
+        self.assertTrue(Tag.objects.filter(pk=tag.pk).exists())
+
+
+class UpsertApiTests(TestCase):
+    """Test getting or creating tags and ingredients by name"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='upsert@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_upsert_single_statement(self):
+        """Test existing ids are returned and missing names created"""
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        other = get_user_model().obj.create_user(
+            email='upsert_other@fulltummy.com',
+            password='mypassword'
+        )
+        Ingredient.objects.create(user=other, name='pepper')
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(INGREDIENTS_UPSERT_URL,
+                                   {'names': ['Salt', 'pepper', 'PEPPER']},
+                                   format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        first, second, third = res.data['results']
+        self.assertEqual(first, {'id': salt.id, 'name': 'salt',
+                                 'created': False})
+        self.assertTrue(second['created'])
+        self.assertEqual(third['id'], second['id'])
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2)
+        upserts = [q for q in ctx.captured_queries
+                   if 'ON CONFLICT' in q['sql']]
+        self.assertEqual(len(upserts), 1)
+
+    def test_upsert_invalid(self):
+        """Test an empty or malformed name list is rejected"""
+        for payload in [{'names': []}, {'names': ['']}, {}]:
+            res = self.client.post(TAGS_UPSERT_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
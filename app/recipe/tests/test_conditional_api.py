@@ -0,0 +1,169 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import versioning
+from core.models import CollectionVersion, Tag, Recipe
+
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalGetTests(TestCase):
+    """Test answering unchanged lists with 304 Not Modified"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='conditional@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                            time_minutes=5, price=5)
+
+    def assertChanged(self, url, etag):
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_not_modified_single_query(self):
+        """Test a matching ETag is answered with one query"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('core_collectionversion', ctx.captured_queries[0]['sql'])
+
+    def test_if_modified_since(self):
+        """Test Last-Modified is honoured when no ETag is sent"""
+        Tag.objects.create(user=self.user, name='veg')
+        last_modified = self.client.get(TAGS_URL)['Last-Modified']
+
+        res = self.client.get(TAGS_URL,
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_varies_with_query(self):
+        """Test filtered and paged lists have their own ETag"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, {'max_price': 1},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_write_changes_etag(self):
+        """Test creating an object changes the collection ETag"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        self.client.post(TAGS_URL, {'name': 'new'})
+
+        self.assertChanged(TAGS_URL, etag)
+
+    def test_link_changes_etag(self):
+        """Test linking a tag changes the recipe and tag ETags"""
+        tag = Tag.objects.create(user=self.user, name='veg')
+        recipes_etag = self.client.get(RECIPES_URL)['ETag']
+        tags_etag = self.client.get(TAGS_URL)['ETag']
+
+        self.recipe.tags.add(tag)
+
+        self.assertChanged(RECIPES_URL, recipes_etag)
+        self.assertChanged(TAGS_URL, tags_etag)
+
+    def test_tag_delete_changes_recipe_etag(self):
+        """Test deleting a linked tag changes the recipe ETag"""
+        tag = Tag.objects.create(user=self.user, name='veg')
+        self.recipe.tags.add(tag)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        tag.delete()
+
+        self.assertChanged(RECIPES_URL, etag)
+
+    def test_bulk_write_changes_etag(self):
+        """Test bulk endpoints bump the collection version"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        self.client.post(RECIPES_BULK_URL, [
+            {'title': 'Bulk', 'time_minutes': 5, 'price': '1.00'}
+        ], format='json')
+
+        self.assertChanged(RECIPES_URL, etag)
+
+    def test_detail_not_modified(self):
+        """Test the recipe detail is conditional as well"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_other_user_write_keeps_etag(self):
+        """Test writes of another user leave the ETag alone"""
+        etag = self.client.get(TAGS_URL)['ETag']
+        other = get_user_model().obj.create_user(
+            email='conditional_other@fulltummy.com',
+            password='mypassword'
+        )
+        Tag.objects.create(user=other, name='theirs')
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_user_delete_writes_no_versions(self):
+        """Test deleting a user does not bump their collections again"""
+        tag = Tag.objects.create(user=self.user, name='veg')
+        self.recipe.tags.add(tag)
+
+        self.user.delete()
+
+        self.assertFalse(CollectionVersion.objects.exists())
+
+    def test_failed_user_delete_bumps_again(self):
+        """Test a user whose delete raised is bumped again afterwards"""
+        with self.assertRaises(RuntimeError):
+            with versioning.deleting(self.user):
+                raise RuntimeError('cascade failed')
+
+        Tag.objects.create(user=self.user, name='veg')
+
+        self.assertTrue(CollectionVersion.objects.filter(
+            user=self.user, collection='tag').exists())
+
+
+class UserDeleteTests(TransactionTestCase):
+    """Test deleting a user with recipes commits"""
+
+    def test_plain_user_delete(self):
+        """Test the cascade writes no version rows failing the commit"""
+        user = get_user_model().obj.create_user(
+            email='conditional_delete@fulltummy.com',
+            password='mypassword'
+        )
+        recipe = Recipe.objects.create(user=user, title='Soup',
+                                       time_minutes=5, price=5)
+        recipe.tags.add(Tag.objects.create(user=user, name='veg'))
+
+        user.delete()
+
+        self.assertFalse(get_user_model().obj.filter(pk=user.pk).exists())
+        self.assertFalse(CollectionVersion.objects.exists())
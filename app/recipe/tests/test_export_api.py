@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class PublicExportApiTests(TestCase):
+    """Test unauthenticated export access"""
+
+    def test_auth_required(self):
+        """Test that auth is required to export"""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateExportApiTests(TestCase):
+    """Test streaming the user's recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='export@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='veg')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='salt')
+
+    def create_recipes(self, count):
+        recipes = [Recipe.objects.create(user=self.user, title='r%d' % i,
+                                         time_minutes=5, price='2.50')
+                   for i in range(count)]
+        for recipe in recipes:
+            recipe.tags.add(self.tag)
+        return recipes
+
+    def read(self, res):
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test recipes are streamed one JSON object per line"""
+        recipe = self.create_recipes(1)[0]
+        recipe.ingredients.add(self.ingredient)
+        other = get_user_model().obj.create_user(
+            email='export_other@fulltummy.com',
+            password='mypassword'
+        )
+        Recipe.objects.create(user=other, title='theirs', time_minutes=5,
+                              price=5)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = self.read(res).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{
+            'id': recipe.id, 'title': 'r0', 'time_minutes': 5,
+            'price': '2.50', 'link': '', 'tags': [self.tag.id],
+            'ingredients': [self.ingredient.id],
+        }])
+
+    def test_export_csv(self):
+        """Test the CSV output has a header and the linked ids"""
+        self.create_recipes(2)
+
+        res = self.client.get(EXPORT_URL, {'output': 'csv'},
+                              HTTP_ACCEPT='text/csv')
+
+        self.assertTrue(res['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(self.read(res))))
+        self.assertEqual([row['title'] for row in rows], ['r0', 'r1'])
+        self.assertEqual(rows[0]['tags'], str(self.tag.id))
+        self.assertEqual(rows[0]['ingredients'], '')
+
+    def test_export_filtered(self):
+        """Test the list filters apply to the export"""
+        self.create_recipes(2)
+        Recipe.objects.create(user=self.user, title='untagged',
+                              time_minutes=5, price=5)
+
+        res = self.client.get(EXPORT_URL, {'tags': self.tag.id})
+
+        self.assertEqual(len(self.read(res).splitlines()), 2)
+
+    @override_settings(RECIPE_EXPORT={'CHUNK_SIZE': 2})
+    def test_export_queries_per_chunk(self):
+        """Test the links are read once per chunk, not per recipe"""
+        self.create_recipes(5)
+
+        with CaptureQueriesContext(connection) as ctx:
+            lines = self.read(self.client.get(EXPORT_URL)).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        tag_queries = [q for q in ctx.captured_queries
+                       if 'FROM "core_recipe_tags"' in q['sql']]
+        self.assertEqual(len(tag_queries), 3)
+
+    def test_invalid_output(self):
+        """Test an unknown output format is rejected"""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
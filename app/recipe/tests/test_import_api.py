@@ -0,0 +1,277 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.exceptions import ImportConflict
+from core.models import Tag, Ingredient, Recipe, RecipeImport, Job
+from recipe.importing import RecipeImporter, read_rows
+
+
+IMPORT_URL = reverse('recipe:recipe-import')
+
+
+def ndjson(*items):
+    return ''.join(json.dumps(item) + '\n' for item in items).encode()
+
+
+def recipe_item(title, tags=(), ingredients=()):
+    return {'title': title, 'time_minutes': 10, 'price': '4.50',
+            'tags': list(tags), 'ingredients': list(ingredients)}
+
+
+class PublicImportApiTests(TestCase):
+    """Test unauthenticated import access"""
+
+    def test_auth_required(self):
+        """Test that auth is required to import"""
+        res = APIClient().post(IMPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateImportApiTests(TestCase):
+    """Test importing recipes for the user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='import@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **data):
+        data['file'] = SimpleUploadedFile(name, content)
+        return self.client.post(IMPORT_URL, data, format='multipart')
+
+    def test_import_ndjson(self):
+        """Test recipes are created with their named tags and ingredients"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        content = ndjson(
+            recipe_item('Curry', ['vegan', 'spicy'], ['rice']),
+            recipe_item('Salad', ['VEGAN'], ['Rice', 'lemon']),
+        )
+
+        res = self.upload('recipes.ndjson', content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 2)
+        self.assertEqual(res.data['failed'], 0)
+        self.assertEqual(
+            sorted(Tag.objects.filter(user=self.user)
+                   .values_list('name', flat=True)), ['Vegan', 'spicy'])
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(),
+                         2)
+        curry = Recipe.objects.get(user=self.user, title='Curry')
+        self.assertEqual(sorted(curry.tags.values_list('name', flat=True)),
+                         ['Vegan', 'spicy'])
+        salad = Recipe.objects.get(user=self.user, title='Salad')
+        self.assertEqual(salad.ingredients.count(), 2)
+        self.assertTrue(Recipe.objects.filter(
+            pk=curry.pk, search_vector__isnull=False).exists())
+
+    def test_import_csv(self):
+        """Test a CSV file lists the names separated by semicolons"""
+        content = (b'title,time_minutes,price,tags,ingredients\n'
+                   b'Soup,20,3.00,warm; quick,leek;potato\n')
+
+        res = self.upload('recipes.csv', content)
+
+        self.assertEqual(res.data['imported'], 1)
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Soup')
+        self.assertEqual(sorted(recipe.tags.values_list('name', flat=True)),
+                         ['quick', 'warm'])
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+    def test_import_row_errors(self):
+        """Test invalid rows are reported by number and the rest imported"""
+        content = ndjson(recipe_item('Good')) + b'not json\n' + \
+            ndjson({'title': 'No price', 'time_minutes': 5})
+
+        res = self.upload('recipes.ndjson', content)
+
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['failed'], 2)
+        self.assertEqual([e['row'] for e in res.data['errors']], [2, 3])
+        self.assertIn('price', res.data['errors'][1]['errors'])
+
+    def test_import_csv_row_errors(self):
+        """Test undecodable and unparsable CSV rows are reported by
+        number and the rest imported"""
+        content = (b'title,time_minutes,price\n'
+                   b'Caf\xe9,5,1.00\n'
+                   b'Big,5,"' + b'x' * (csv.field_size_limit() + 1) +
+                   b'"\n'
+                   b'Soup,20,3.00\n')
+
+        res = self.upload('recipes.csv', content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual([e['row'] for e in res.data['errors']], [1, 2])
+        self.assertEqual(res.data['errors'][0]['errors'],
+                         {'non_field_errors': ['Invalid UTF-8.']})
+
+    def test_import_invalid_input(self):
+        """Test a missing file or unknown format is rejected"""
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.upload('recipes.xml', b'', input='xml')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_resumes(self):
+        """Test posting the same key again skips the rows already done"""
+        content = ndjson(*[recipe_item('r%d' % i) for i in range(3)])
+        self.upload('recipes.ndjson', content[:content.rindex(b'{')],
+                    key='weekly')
+
+        res = self.upload('recipes.ndjson', content, key='weekly')
+
+        self.assertEqual(res.data['skipped'], 2)
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(
+            RecipeImport.objects.get(user=self.user, key='weekly').rows_done,
+            3)
+
+    def test_import_edited_file(self):
+        """Test a file edited to the same name and size is imported
+        again by default, not resumed"""
+        self.upload('recipes.ndjson', ndjson(recipe_item('r1')))
+
+        res = self.upload('recipes.ndjson', ndjson(recipe_item('r2')))
+
+        self.assertEqual(res.data['skipped'], 0)
+        self.assertEqual(res.data['imported'], 1)
+
+    def test_import_concurrent_run(self):
+        """Test a run whose key another run advanced stops without
+        importing the rows again"""
+        content = ndjson(*[recipe_item('r%d' % i) for i in range(2)])
+        importer = RecipeImporter(self.user, 'twice', batch_size=1)
+        rows = read_rows(iter(content.splitlines()), 'ndjson')
+
+        def other_run(result):
+            if result['rows'] == 1:
+                RecipeImporter(self.user, 'twice').run(
+                    read_rows(iter(content.splitlines()), 'ndjson'))
+        importer.progress = other_run
+
+        with self.assertRaises(ImportConflict):
+            importer.run(rows)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            RecipeImport.objects.get(user=self.user, key='twice').rows_done,
+            2)
+
+    def test_import_name_deleted(self):
+        """Test a tag deleted between batches is created again instead
+        of failing the link"""
+        content = ndjson(*[recipe_item('r%d' % i, ['vegan'])
+                           for i in range(2)])
+        importer = RecipeImporter(self.user, 'deleted', batch_size=1)
+
+        def delete_tag(result):
+            if result['rows'] == 1:
+                Tag.objects.filter(user=self.user).delete()
+        importer.progress = delete_tag
+
+        result = importer.run(read_rows(iter(content.splitlines()),
+                                        'ndjson'))
+
+        self.assertEqual(result['imported'], 2)
+        recipe = Recipe.objects.get(user=self.user, title='r1')
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)),
+                         ['vegan'])
+
+    def test_import_background(self):
+        """Test a background import is queued and run by a job"""
+        content = ndjson(recipe_item('Later', ['queued']))
+        file_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, file_dir)
+        override = override_settings(JOBS={**settings.JOBS,
+                                           'FILE_DIR': file_dir})
+        override.enable()
+        self.addCleanup(override.disable)
+
+        res = self.upload('recipes.ndjson', content, background='1')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res['Location'],
+                         reverse('core:job', args=[res.data['id']]))
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+        for pk in Job.objects.dequeue('test', 10, 60):
+            jobs.run(Job.objects.get(pk=pk))
+
+        job = Job.objects.get(pk=res.data['id'])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result['imported'], 1)
+        self.assertEqual(os.listdir(os.path.join(file_dir, 'recipe.import')),
+                         [])
+        self.assertTrue(Recipe.objects.filter(user=self.user,
+                                              title='Later').exists())
+
+    @override_settings(RECIPE_IMPORT={'BATCH_SIZE': 2, 'MAX_ERRORS': 10})
+    def test_import_queries_per_batch(self):
+        """Test the queries grow with the batches, not the rows"""
+        keys = []
+
+        def queries(count):
+            keys.append(count)
+            content = ndjson(*[
+                recipe_item('r%d' % i, ['t%d' % i], ['i%d' % i])
+                for i in range(count)])
+            with CaptureQueriesContext(connection) as ctx:
+                RecipeImporter(self.user, 'q%d' % len(keys)).run(
+                    read_rows(iter(content.splitlines()), 'ndjson'))
+            return len(ctx.captured_queries)
+
+        # The first batch also creates the user's collection versions
+        queries(2)
+        two, four, six = queries(2), queries(4), queries(6)
+        self.assertEqual(six - four, four - two)
+        self.assertLess(six - four, 20)
+
+
+class ImportCommandTests(TestCase):
+    """Test the import_recipes command"""
+
+    def test_import_recipes(self):
+        """Test the command imports a file and resumes by path"""
+        user = get_user_model().obj.create_user(
+            email='cli_import@fulltummy.com',
+            password='mypassword'
+        )
+        with tempfile.NamedTemporaryFile(suffix='.ndjson',
+                                         delete=False) as f:
+            f.write(ndjson(recipe_item('Stew', ['winter'])))
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_recipes', user.email, f.name, stdout=out)
+        call_command('import_recipes', user.email, f.name, stdout=out)
+
+        self.assertIn('Imported 1 recipes', out.getvalue())
+        self.assertIn('Imported 0 recipes, 0 rows failed, 1 skipped',
+                      out.getvalue())
+        self.assertEqual(Recipe.objects.filter(user=user).count(), 1)
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe
+
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class KeysetPaginationTests(TestCase):
+    """Test cursor pagination of the recipe app endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='pagination@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def fetch_all(self, url):
+        """Follow the next links and return the ids of every page"""
+        pages = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in res.data['results']])
+            url = res.data['next']
+        return pages
+
+    def test_pages_cover_all_names(self):
+        """Test paging by (name, id) neither skips nor repeats rows"""
+        for name in ['salt', 'sea salt', 'basil', 'pepper', 'veg']:
+            Tag.objects.create(user=self.user, name=name)
+
+        pages = self.fetch_all(TAGS_URL + '?page_size=2')
+
+        expected = Tag.objects.order_by('-name', '-id') \
+            .values_list('id', flat=True)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sum(pages, []), list(expected))
+
+    def test_recipes_paged_by_id(self):
+        """Test recipes are paged newest first"""
+        for i in range(5):
+            Recipe.objects.create(user=self.user, title='recipe %d' % i,
+                                  time_minutes=5, price=5)
+
+        pages = self.fetch_all(RECIPES_URL + '?page_size=2')
+
+        expected = Recipe.objects.order_by('-id').values_list('id', flat=True)
+        self.assertEqual(sum(pages, []), list(expected))
+
+    def test_deep_page_seeks(self):
+        """Test a later page seeks past the cursor instead of an OFFSET"""
+        for i in range(3):
+            Tag.objects.create(user=self.user, name='tag %d' % i)
+        res = self.client.get(TAGS_URL, {'page_size': 1})
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(res.data['next'])
+
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('LIMIT 2', sql)
+
+    def test_page_size_limited(self):
+        """Test the page size can not exceed the maximum"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(TAGS_URL, {'page_size': 100000})
+
+        self.assertIn('LIMIT 201', ctx.captured_queries[-1]['sql'])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        for cursor in ['not-base64!', 'WyJhIl0=']:
+            res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Ingredient, Recipe
+from core.tests.utils import QueryCountMixin
 
 from recipe.serializers import RecipeSerializer
 
@@ -51,7 +54,7 @@ class PublicRecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateRecipeApiTests(TestCase):
+class PrivateRecipeApiTests(QueryCountMixin, TestCase):
     """Test authorized recipe APIs"""
 
     def setUp(self):
@@ -72,7 +75,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_limited_to_user(self):
         """Test if only the recipes created by current user are listed"""
@@ -85,11 +88,11 @@ class PrivateRecipeApiTests(TestCase):
 
         res = self.client.get(RECIPES_URL)
 
-        recipes = Recipe.objects.filter(user=self.user)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_create(self):
         """Test creating recipe"""
@@ -182,3 +185,165 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(recipe.price, payload['price'])
         tags = recipe.tags.all()
         self.assertEqual(tags.count(), 0)
+
+    def test_recipe_list_constant_queries(self):
+        """Test listing recipes does not query once per recipe"""
+        def add_recipe():
+            recipe = sample_recipe(user=self.user)
+            name = 'item %d' % recipe.id
+            recipe.tags.add(sample_tag(user=self.user, name=name))
+            recipe.ingredients.add(sample_ingredient(user=self.user,
+                                                     name=name))
+
+        self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL), add_recipe)
+
+    def test_recipe_detail_prefetched(self):
+        """Test the recipe detail returns the linked ids"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'], [tag.id])
+        self.assertEqual(res.data['ingredients'], [ingredient.id])
+
+    def test_recipe_create_foreign_tag(self):
+        """Test linking another user's tag is rejected"""
+        other = get_user_model().obj.create_user(
+            email="recipe_other@fulltummy.com",
+            password="password"
+        )
+        own = sample_tag(user=self.user)
+        foreign = sample_tag(user=other)
+        payload = {'title': 'Soup', 'time_minutes': 5, 'price': 5,
+                   'tags': [own.id, foreign.id]}
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['tags'],
+                         ['Invalid pk "%d" - object does not exist.'
+                          % foreign.id])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_recipe_create_validates_ids_in_one_query(self):
+        """Test related ids are resolved with one query per relation"""
+        ingredients = [sample_ingredient(user=self.user, name='i%d' % i)
+                       for i in range(40)]
+        payload = {'title': 'Stew', 'time_minutes': 5, 'price': 5,
+                   'ingredients': [i.id for i in ingredients], 'tags': []}
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        lookups = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('SELECT')
+                   and '"core_ingredient"."user_id" =' in q['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(len(res.data['ingredients']), 40)
+
+    def test_recipe_patch_minimal_diff(self):
+        """Test unchanged links are kept and only the changes written"""
+        recipe = sample_recipe(user=self.user)
+        keep = sample_tag(user=self.user, name='keep')
+        drop = sample_tag(user=self.user, name='drop')
+        add = sample_tag(user=self.user, name='add')
+        recipe.tags.add(keep, drop)
+        through = Recipe.tags.through
+        kept_link = through.objects.get(recipe=recipe, tag=keep).id
+
+        res = self.client.patch(detail_url(recipe.id),
+                                {'tags': [keep.id, add.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(res.data['tags']), [keep.id, add.id])
+        self.assertEqual(through.objects.get(recipe=recipe, tag=keep).id,
+                         kept_link)
+        self.assertEqual(set(recipe.tags.all()), {keep, add})
+
+    def test_recipe_patch_unchanged_links(self):
+        """Test resending the same links writes no through rows"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(detail_url(recipe.id),
+                                    {'tags': [tag.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [q for q in ctx.captured_queries
+                  if q['sql'].startswith(('INSERT INTO "core_recipe_tags"',
+                                          'DELETE FROM "core_recipe_tags"'))]
+        self.assertEqual(writes, [])
+
+    def test_filter_recipes_by_tags(self):
+        """Test returning recipes with any of the given tags"""
+        recipe1 = sample_recipe(user=self.user, title='Veg curry')
+        recipe2 = sample_recipe(user=self.user, title='Fish curry')
+        recipe3 = sample_recipe(user=self.user, title='Plain rice')
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Fish')
+        recipe1.tags.add(tag1, tag2)
+        recipe2.tags.add(tag2)
+
+        res = self.client.get(
+            RECIPES_URL, {'tags': '%s,%s' % (tag1.id, tag2.id)})
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [recipe2.id, recipe1.id])
+        self.assertNotIn(recipe3.id, ids)
+
+    def test_filter_recipes_by_ingredients(self):
+        """Test returning recipes with the given ingredients"""
+        recipe1 = sample_recipe(user=self.user, title='Lemon rice')
+        recipe2 = sample_recipe(user=self.user, title='Tomato rice')
+        ingredient = sample_ingredient(user=self.user, name='Lemon')
+        recipe1.ingredients.add(ingredient)
+
+        res = self.client.get(RECIPES_URL, {'ingredients': ingredient.id})
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [recipe1.id])
+        self.assertNotIn(recipe2.id, ids)
+
+    def test_filter_recipes_by_price_and_time(self):
+        """Test the max_price and max_time_minutes filters"""
+        cheap = sample_recipe(user=self.user, price=5, time_minutes=10)
+        sample_recipe(user=self.user, price=5, time_minutes=60)
+        sample_recipe(user=self.user, price=50, time_minutes=10)
+
+        res = self.client.get(
+            RECIPES_URL, {'max_price': '5.00', 'max_time_minutes': 10})
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [cheap.id])
+
+    def test_filter_recipes_single_query(self):
+        """Test filters compile to EXISTS subqueries in one query"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECIPES_URL, {'tags': tag.id,
+                                          'ingredients': ingredient.id})
+
+        queries = [q['sql'] for q in ctx.captured_queries
+                   if 'FROM "core_recipe"' in q['sql']]
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]
+        self.assertEqual(sql.count('EXISTS'), 2)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_filter_recipes_invalid(self):
+        """Test malformed filter values are rejected"""
+        for params in [{'tags': 'a,b'}, {'max_price': 'cheap'}]:
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
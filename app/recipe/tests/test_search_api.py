@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+
+
+def sample_recipe(user, title):
+    return Recipe.objects.create(user=user, title=title, time_minutes=5,
+                                 price=5)
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test full-text search over recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().obj.create_user(
+            email='search@fulltummy.com',
+            password='mypassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, terms, **params):
+        res = self.client.get(RECIPES_URL, {'search': terms, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_title(self):
+        """Test matching the title, with stemming"""
+        soup = sample_recipe(self.user, 'Tomato soups')
+        sample_recipe(self.user, 'Cheese cake')
+
+        self.assertEqual(self.search('soup'), [soup.id])
+
+    def test_search_follows_title_update(self):
+        """Test editing the title through the API reindexes the recipe"""
+        recipe = sample_recipe(self.user, 'Soup')
+
+        self.client.patch(reverse('recipe:recipe-detail', args=[recipe.id]),
+                          {'title': 'Pancakes'})
+
+        self.assertEqual(self.search('soup'), [])
+        self.assertEqual(self.search('pancake'), [recipe.id])
+
+    def test_search_linked_names(self):
+        """Test matching tag and ingredient names"""
+        tagged = sample_recipe(self.user, 'Salad')
+        tagged.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+        spiced = sample_recipe(self.user, 'Curry')
+        spiced.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='cumin'))
+
+        self.assertEqual(self.search('vegan'), [tagged.id])
+        self.assertEqual(self.search('cumin'), [spiced.id])
+
+    def test_search_follows_renames_and_unlinks(self):
+        """Test the vector is refreshed when a tag changes"""
+        recipe = sample_recipe(self.user, 'Salad')
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        recipe.tags.add(tag)
+
+        tag.name = 'spicy'
+        tag.save()
+        self.assertEqual(self.search('vegan'), [])
+        self.assertEqual(self.search('spicy'), [recipe.id])
+
+        recipe.tags.remove(tag)
+        self.assertEqual(self.search('spicy'), [])
+
+    def test_search_tag_deleted(self):
+        """Test deleting a linked tag drops it from the vector"""
+        recipe = sample_recipe(self.user, 'Salad')
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        recipe.tags.add(tag)
+
+        tag.delete()
+
+        self.assertEqual(self.search('vegan'), [])
+
+    def test_search_tags_bulk_deleted(self):
+        """Test deleting linked tags in bulk reindexes their recipes with
+        the same queries for any number of tags"""
+        def delete_linked(count):
+            recipe = sample_recipe(self.user, 'Salad')
+            tags = [Tag.objects.create(user=self.user, name='vegan%d' % i)
+                    for i in range(count)]
+            recipe.tags.add(*tags)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.delete(TAGS_BULK_URL,
+                                   {'ids': [tag.id for tag in tags]},
+                                   format='json')
+            return len(ctx.captured_queries)
+
+        self.assertEqual(delete_linked(1), delete_linked(3))
+        self.assertEqual(self.search('vegan0'), [])
+        self.assertEqual(len(self.search('salad')), 2)
+
+    def test_search_ranked(self):
+        """Test title matches rank above ingredient matches"""
+        by_ingredient = sample_recipe(self.user, 'Stew')
+        by_ingredient.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='potato'))
+        by_title = sample_recipe(self.user, 'Potato gratin')
+
+        self.assertEqual(self.search('potato'),
+                         [by_title.id, by_ingredient.id])
+
+    def test_search_paginated(self):
+        """Test cursors walk ranked results without gaps or repeats"""
+        ids = {sample_recipe(self.user, 'Rice %d' % i).id for i in range(5)}
+        seen = []
+        params = {'search': 'rice', 'page_size': 2}
+        url = RECIPES_URL
+        while url:
+            res = self.client.get(url, params)
+            seen += [recipe['id'] for recipe in res.data['results']]
+            url, params = res.data['next'], None
+
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_search_limited_to_user(self):
+        """Test other users' recipes are not searched"""
+        other = get_user_model().obj.create_user(
+            email='search_other@fulltummy.com',
+            password='mypassword'
+        )
+        sample_recipe(other, 'Soup')
+
+        self.assertEqual(self.search('soup'), [])
+
+    def test_search_bulk_writes(self):
+        """Test recipes created and tags renamed in bulk are searchable"""
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        res = self.client.post(RECIPES_BULK_URL, [
+            {'title': 'Lentil soup', 'time_minutes': 5, 'price': '1.00',
+             'tags': [tag.id]},
+        ], format='json')
+        recipe_id = res.data['results'][0]['id']
+        self.assertEqual(self.search('lentil'), [recipe_id])
+
+        self.client.patch(TAGS_BULK_URL, [{'id': tag.id, 'name': 'quick'}],
+                          format='json')
+
+        self.assertEqual(self.search('quick'), [recipe_id])
@@ -5,7 +5,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 
@@ -41,10 +41,10 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
 
-        tags = Tag.objects.all().order_by("-name")
+        tags = Tag.objects.all().order_by("-name", "-id")
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Tests the tags are listed only for authenticated user"""
@@ -55,8 +55,8 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """Test creating a new tag"""
@@ -74,3 +74,42 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_tag_duplicate(self):
+        """Test a name the user already has is rejected ignoring case"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        user2 = get_user_model().obj.create_user("useremail2@fulltummy.com",
+                                                 "password123457")
+        Tag.objects.create(user=user2, name='keto')
+
+        res = self.client.post(TAGS_URL, {'name': 'vegan'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TAGS_URL, {'name': 'keto'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_retrieve_tags_assigned_only(self):
+        """Test filtering tags by those assigned to recipes"""
+        tag1 = Tag.objects.create(user=self.user, name="Breakfast")
+        tag2 = Tag.objects.create(user=self.user, name="Lunch")
+        recipe = Recipe.objects.create(user=self.user, title="Eggs",
+                                       time_minutes=10, price=5)
+        recipe.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        names = [tag['name'] for tag in res.data['results']]
+        self.assertIn(tag1.name, names)
+        self.assertNotIn(tag2.name, names)
+
+    def test_retrieve_tags_assigned_unique(self):
+        """Test a tag used by several recipes is returned once"""
+        tag = Tag.objects.create(user=self.user, name="Breakfast")
+        for title in ["Eggs", "Toast"]:
+            recipe = Recipe.objects.create(user=self.user, title=title,
+                                           time_minutes=10, price=5)
+            recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
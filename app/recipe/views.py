@@ -1,52 +1,182 @@
+from core import search, versioning
+from core.authentication import CachedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
+from core.query_budget import QueryBudget, QueryBudgetMixin
+from core.response_cache import ResponseCacheMixin
+from core.versioning import ConditionalGetMixin
+
+from django.db.models.functions import Lower
 
 from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from recipe import serializers
+from recipe import filters, serializers
+from recipe.autocomplete import AutocompleteMixin
+from recipe.bulk import BulkModelMixin
+from recipe.export import ExportMixin
+from recipe.importing import ImportMixin
+from recipe.pagination import KeysetPagination
 
 
-class BaseRecipeAttr(viewsets.GenericViewSet,
+class BaseRecipeAttr(QueryBudgetMixin,
+                     ConditionalGetMixin,
+                     ResponseCacheMixin,
+                     AutocompleteMixin,
+                     BulkModelMixin,
+                     viewsets.GenericViewSet,
                      mixins.ListModelMixin,
                      mixins.CreateModelMixin):
     """Base class for recipe app viewsets"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-name', '-id')
+    query_budgets = {
+        'list': QueryBudget(queries=5, db_ms=50),
+        'autocomplete': QueryBudget(queries=3, db_ms=50),
+        'create': QueryBudget(queries=8),
+        'upsert': QueryBudget(queries=4),
+        'bulk': QueryBudget(queries=12),
+    }
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        queryset = self.queryset.filter(user=self.request.user)
+        queryset = filters.filter_assigned(
+            queryset, self.request.query_params, self.assigned_through)
+        return queryset.order_by(*self.keyset_ordering)
 
     def perform_create(self, serializer):
         """Create a new tag"""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def upsert(self, request):
+        """Return the ids of the given names, creating the missing ones"""
+        serializer = serializers.NameListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        model = self.queryset.model
+        rows = model.objects.upsert(request.user,
+                                    serializer.validated_data['names'])
+        if any(created for _, _, created in rows):
+            versioning.bump(request.user.pk, model)
+
+        return Response({'results': [
+            {'id': pk, 'name': name, 'created': created}
+            for pk, name, created in rows
+        ]})
+
+    def validate_items(self, items, instances=None):
+        validated, errors = super().validate_items(items, instances)
+        self.check_unique_names(validated, errors, instances)
+        return validated, errors
+
+    def check_unique_names(self, validated, errors, instances):
+        """Reject names repeated in the request or already taken, with
+        one query"""
+        first = {}
+        for index, data in enumerate(validated):
+            if not data or 'name' not in data:
+                continue
+            key = data['name'].lower()
+            if key in first:
+                errors.setdefault(index, {})['name'] = [
+                    'Repeats item %d.' % first[key]]
+            else:
+                first[key] = index
+        if not first:
+            return
+
+        renamed = [instance.pk for instance, data
+                   in zip(instances or (), validated)
+                   if instance is not None and data and 'name' in data]
+        taken = set(self.queryset.model.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(
+            user=self.request.user, lower_name__in=list(first)
+        ).exclude(pk__in=renamed).values_list('lower_name', flat=True))
+        for key in taken:
+            errors.setdefault(first[key], {})['name'] = [
+                serializers.UniqueNameMixin.duplicate_name_message
+                % validated[first[key]]['name']]
+
+    def bulk_deleting(self, queryset):
+        return search.unlinking(self.queryset.model,
+                                queryset.values_list('pk', flat=True))
+
+    def bulk_changed(self, user, instances, created=False):
+        super().bulk_changed(user, instances, created)
+        if created:
+            return
+        recipe_ids = search.linked_recipe_ids(
+            self.queryset.model, [instance.pk for instance in instances])
+        if recipe_ids:
+            search.update_search_vectors(recipe_ids)
+            versioning.bump(user.pk, Recipe)
+
 
 class TagViewSet(BaseRecipeAttr):
     """Manage tags in database"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    assigned_through = Recipe.tags.through
 
 
 class IngredientViewSet(BaseRecipeAttr):
     """Manage Ingredients in database"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    assigned_through = Recipe.ingredients.through
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(QueryBudgetMixin, ConditionalGetMixin, ResponseCacheMixin,
+                    BulkModelMixin, ExportMixin, ImportMixin,
+                    viewsets.ModelViewSet):
     """Manage recipe in database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.defer('search_vector')
     serializer_class = serializers.RecipeSerializer
+    bulk_serializer_class = serializers.RecipeBulkSerializer
+    bulk_relations = ('ingredients', 'tags')
+    query_budgets = {
+        'list': QueryBudget(queries=6, db_ms=100),
+        'retrieve': QueryBudget(queries=5, db_ms=50),
+        'create': QueryBudget(queries=16),
+        'update': QueryBudget(queries=20),
+        'partial_update': QueryBudget(queries=20),
+        'bulk': QueryBudget(queries=20),
+        # A constant number of queries per batch, unbounded per file
+        'import_recipes': QueryBudget(),
+    }
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'list' and \
+                filters.search_terms(self.request.query_params):
+            return ('-rank', '-id')
+        return ('-id',)
 
     def get_queryset(self):
         """Return objects for the current auth user only"""
-        return self.queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            queryset = filters.filter_recipes(
+                queryset, self.request.query_params)
+        queryset = queryset.order_by(*self.keyset_ordering)
+        return self.get_serializer_class().setup_eager_loading(queryset)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Creates a new recipe with user assigned"""
         serializer.save(user=self.request.user)
+
+    def bulk_changed(self, user, instances, created=False):
+        super().bulk_changed(user, instances, created)
+        search.update_search_vectors(instance.pk for instance in instances)
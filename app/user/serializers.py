@@ -2,8 +2,10 @@ from django.contrib.auth import get_user_model, authenticate
 from django. utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from core.serializers import MeasuredSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Serializer for the user objects"""
 
     class Meta:
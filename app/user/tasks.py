@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import jobs, search, versioning
+from core.models import Ingredient, Recipe, Tag
+
+# Recipes deleted per transaction
+BATCH_SIZE = 500
+
+
+@jobs.task('user.delete')
+def delete_user(job):
+    """Delete a deactivated account, its recipes first in batches so no
+    transaction holds all of its rows"""
+    user = get_user_model().obj.filter(pk=job.payload['user_id'],
+                                       is_active=False).first()
+    if user is None:
+        return {'recipes': 0}
+
+    recipes = 0
+    with versioning.deleting(user):
+        while True:
+            ids = list(Recipe.objects.filter(user=user).values_list(
+                'pk', flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            with transaction.atomic():
+                for through in (Recipe.tags.through,
+                                Recipe.ingredients.through):
+                    through.objects.filter(recipe_id__in=ids).delete()
+                Recipe.objects.filter(pk__in=ids).delete()
+            recipes += len(ids)
+            jobs.heartbeat(job)
+        # The recipes are gone, only skip a lookup per cascaded row
+        tags = Tag.objects.filter(user=user).values_list('pk', flat=True)
+        ingredients = Ingredient.objects.filter(user=user).values_list(
+            'pk', flat=True)
+        with search.unlinking(Tag, tags), \
+                search.unlinking(Ingredient, ingredients):
+            user.delete()
+    return {'recipes': recipes}
@@ -1,12 +1,32 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.exceptions import ServiceBusy
+from core.hashing import HashingPool
+from core import jobs
+from core.models import AuthToken, Job, Recipe, Tag
+from core.throttling import reset_login_guard
+
 
 CREATE_USER_URL = reverse('user:create')
+LOGIN_THROTTLE = {
+    'IP': {'CAPACITY': 3, 'RATE': 0.01},
+    'EMAIL': {'CAPACITY': 100, 'RATE': 1},
+    'LOCKOUT': {'THRESHOLD': 2, 'BASE': 60, 'MAX': 3600},
+    'MAX_ENTRIES': 100,
+    'SHARED_CACHE': 'shared',
+}
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
 
@@ -108,6 +128,133 @@ class PublicUserApiTests(TestCase):
             self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class TokenApiTests(TestCase):
+    """Test issuing expiring tokens"""
+
+    def setUp(self):
+        reset_login_guard()
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.payload = {'email': 'token@email.com', 'password': 'test1234'}
+        self.user = create_user(**self.payload)
+
+    def test_create_token(self):
+        """Test that an expiring token is issued for valid credentials"""
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        token = AuthToken.objects.get(key=res.data['token'])
+        self.assertEqual(token.user, self.user)
+        self.assertIn('expires_at', res.data)
+
+    def test_token_reused_while_fresh(self):
+        """Test logging in again returns the same fresh token"""
+        first = self.client.post(TOKEN_URL, self.payload)
+        second = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(first.data['token'], second.data['token'])
+
+    def test_token_rotated_when_half_used(self):
+        """Test a new key is issued once the token is past half life"""
+        old = AuthToken.objects.create(
+            user=self.user,
+            expires_at=timezone.now() + timedelta(seconds=10)
+        )
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertNotEqual(res.data['token'], old.key)
+        self.assertEqual(AuthToken.objects.filter(user=self.user).count(), 2)
+
+    def test_hashing_busy(self):
+        """Test logins are rejected with 503 when hashing is saturated"""
+        with patch.object(HashingPool, 'run',
+                          side_effect=ServiceBusy(wait=1)):
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+
+@override_settings(LOGIN_THROTTLE=LOGIN_THROTTLE)
+class LoginThrottleTests(TestCase):
+    """Test throttling and locking out token requests"""
+
+    def setUp(self):
+        reset_login_guard()
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.payload = {'email': 'throttle@email.com', 'password': 'test1234'}
+        self.user = create_user(**self.payload)
+        self.wrong = {'email': 'throttle@email.com', 'password': 'wrong'}
+
+    def test_ip_bucket(self):
+        """Test an address is limited once its bucket is empty"""
+        for _ in range(3):
+            self.client.post(TOKEN_URL, {'email': 'x@email.com'})
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    def test_ip_bucket_ignores_forwarded_for(self):
+        """Test a spoofed X-Forwarded-For does not get a fresh bucket"""
+        for i in range(3):
+            self.client.post(TOKEN_URL, {'email': 'x@email.com'},
+                             HTTP_X_FORWARDED_FOR='10.1.0.%d' % i)
+
+        res = self.client.post(TOKEN_URL, self.payload,
+                               HTTP_X_FORWARDED_FOR='10.1.0.9')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_reject_is_cheap(self):
+        """Test a throttled request neither queries nor hashes"""
+        for _ in range(3):
+            self.client.post(TOKEN_URL, {'email': 'x@email.com'})
+
+        with patch.object(HashingPool, 'run') as run, \
+                CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        run.assert_not_called()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_email_lockout(self):
+        """Test an email is locked out after repeated failures"""
+        self.client.post(TOKEN_URL, self.wrong)
+        self.client.post(TOKEN_URL, self.wrong, REMOTE_ADDR='10.0.0.2')
+
+        res = self.client.post(TOKEN_URL, self.payload,
+                               REMOTE_ADDR='10.0.0.3')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(res['Retry-After']), 59)
+
+    def test_success_resets_failures(self):
+        """Test a successful login clears the email's failures"""
+        self.client.post(TOKEN_URL, self.wrong)
+        self.client.post(TOKEN_URL, self.payload, REMOTE_ADDR='10.0.0.2')
+
+        self.client.post(TOKEN_URL, self.wrong, REMOTE_ADDR='10.0.0.3')
+        res = self.client.post(TOKEN_URL, self.payload,
+                               REMOTE_ADDR='10.0.0.4')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_shared_across_workers(self):
+        """Test a worker with fresh local buckets sees the shared limit"""
+        for _ in range(3):
+            self.client.post(TOKEN_URL, {'email': 'x@email.com'})
+        reset_login_guard()
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
 class PrivateUserApiTests(TestCase):
     """"Test APi requests that require authentication"""
 
@@ -143,3 +290,30 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user(self):
+        """test deleting the account deactivates it and queues a job
+        deleting its data"""
+        AuthToken.objects.issue(self.user)
+        tag = Tag.objects.create(user=self.user, name='veg')
+        for i in range(3):
+            recipe = Recipe.objects.create(user=self.user, title='r%d' % i,
+                                           time_minutes=5, price=5)
+            recipe.tags.add(tag)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(AuthToken.objects.filter(user=self.user).exists())
+
+        for pk in Job.objects.dequeue('test', 10, 60):
+            jobs.run(Job.objects.get(pk=pk))
+
+        job = Job.objects.get(pk=res.data['id'])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {'recipes': 3})
+        self.assertFalse(
+            get_user_model().obj.filter(pk=self.user.pk).exists())
+        self.assertFalse(Recipe.objects.exists())
@@ -1,6 +1,13 @@
-from rest_framework import generics, authentication, permissions
+from django.db import transaction
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core import jobs
+from core.authentication import CachedTokenAuthentication
+from core.models import AuthToken
+from core.throttling import LoginEmailThrottle, LoginIPThrottle
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -13,14 +20,44 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = (LoginIPThrottle, LoginEmailThrottle)
 
+    def post(self, request, *args, **kwargs):
+        """Issue an expiring token, rotating the key once it is half used"""
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except ValidationError as exc:
+            codes = exc.get_codes()
+            if 'authentication' in codes.get('non_field_errors', ()):
+                for throttle in self.get_throttles():
+                    throttle.failed(request)
+            raise
+        for throttle in self.get_throttles():
+            throttle.succeeded(request)
+        token = AuthToken.objects.issue(serializer.validated_data['user'])
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+        return Response({'token': token.key, 'expires_at': token.expires_at})
+
+
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """retrieve and return authenticated user"""
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the user and revoke their tokens, the data is
+        deleted by a background job"""
+        user = self.get_object()
+        with transaction.atomic():
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            AuthToken.objects.filter(user=user).delete()
+            job = jobs.enqueue('user.delete', {'user_id': user.pk},
+                               user=user)
+        return jobs.accepted(job)